@@ -0,0 +1,86 @@
+import numpy as np
+
+
+# Sutherland–Hodgman: полигон последовательно режется четырьмя полуплоскостями окна,
+# каждая полуплоскость обрабатывается сразу для всех вершин
+def clip_polygon(vertices, xmin, xmax, ymin, ymax):
+    points = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return points
+    # min/max по столбцам-срезам: reduce по axis=0 для (N, 2) на порядок медленнее
+    xs, ys = points[:, 0], points[:, 1]
+    x_lo, x_hi, y_lo, y_hi = xs.min(), xs.max(), ys.min(), ys.max()
+    if x_lo >= xmin and x_hi <= xmax and y_lo >= ymin and y_hi <= ymax:
+        return points
+    if x_hi < xmin or x_lo > xmax or y_hi < ymin or y_lo > ymax:
+        return points[:0]
+
+    for axis, bound, sign in ((0, xmin, 1.0), (0, xmax, -1.0), (1, ymin, 1.0), (1, ymax, -1.0)):
+        distance = sign * (points[:, axis] - bound)
+        inside = distance >= 0
+        if inside.all():
+            continue
+        if not inside.any():
+            return points[:0]
+
+        # Ребро prev -> point даёт точку пересечения (если пересекает границу), затем point (если внутри)
+        crossing = inside != np.roll(inside, 1)
+        counts = crossing.astype(np.intp) + inside
+        offsets = np.cumsum(counts) - counts
+        clipped = np.empty((int(counts.sum()), 2))
+        clipped[offsets[inside] + crossing[inside]] = points[inside]
+
+        cur = np.flatnonzero(crossing)
+        prev = cur - 1
+        t = distance[prev] / (distance[prev] - distance[cur])
+        intersections = points[prev] + t[:, None] * (points[cur] - points[prev])
+        intersections[:, axis] = bound
+        clipped[offsets[cur]] = intersections
+        points = clipped
+    return points
+
+
+
+# Liang–Barsky для массива отрезков (N, 2, 2); границы могут быть массивами той же длины.
+# Возвращает параметры видимой части t0, t1 и маску отрезков, задевающих окно
+def liang_barsky_batch(segments, xmin, xmax, ymin, ymax):
+    starts = segments[:, 0]
+    d = segments[:, 1] - starts
+    p = np.stack([-d[:, 0], d[:, 0], -d[:, 1], d[:, 1]], axis=1)
+    q = np.stack([starts[:, 0] - xmin, xmax - starts[:, 0],
+                  starts[:, 1] - ymin, ymax - starts[:, 1]], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = q / p
+    t0 = np.where(p < 0, t, 0.0).max(axis=1)
+    t1 = np.where(p > 0, t, 1.0).min(axis=1)
+    visible = ~((p == 0) & (q < 0)).any(axis=1) & (t0 <= t1)
+    return t0, t1, visible
+
+def _points_at(starts, ends, t):
+    points = starts + t[:, None] * (ends - starts)
+    return np.where((t == 1.0)[:, None], ends, points)
+
+# Видимые части (K, 2, 2) и номер исходного отрезка для каждой
+def clip_segments(segments, xmin, xmax, ymin, ymax):
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    t0, t1, visible = liang_barsky_batch(segments, xmin, xmax, ymin, ymax)
+    owner = np.flatnonzero(visible)
+    starts, ends = segments[owner, 0], segments[owner, 1]
+    pieces = np.stack([_points_at(starts, ends, t0[owner]), _points_at(starts, ends, t1[owner])], axis=1)
+    return pieces, owner
+
+# Внешние части (до входа в окно и после выхода), не больше двух на отрезок
+def clip_segments_outside(segments, xmin, xmax, ymin, ymax):
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    t0, t1, visible = liang_barsky_batch(segments, xmin, xmax, ymin, ymax)
+
+    n = len(segments)
+    piece_start = np.stack([np.zeros(n), t1], axis=1).ravel()
+    piece_end = np.stack([np.where(visible, t0, 1.0), np.ones(n)], axis=1).ravel()
+    keep = np.stack([~visible | (t0 > 0), visible & (t1 < 1)], axis=1).ravel()
+    owner = np.repeat(np.arange(n), 2)[keep]
+
+    starts, ends = segments[owner, 0], segments[owner, 1]
+    pieces = np.stack([_points_at(starts, ends, piece_start[keep]),
+                       _points_at(starts, ends, piece_end[keep])], axis=1)
+    return pieces, owner
@@ -0,0 +1,157 @@
+from collections import namedtuple
+
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+POSITION_LOCATION = 0
+NORMAL_LOCATION = 1
+
+# Значения по умолчанию совпадают с начальным состоянием GL_LIGHT0 и glMaterial
+Light = namedtuple("Light", ["position", "ambient", "diffuse", "specular"],
+                   defaults=[(0.0, 0.0, 1.0, 0.0), (0.0, 0.0, 0.0), (1.0, 1.0, 1.0), (1.0, 1.0, 1.0)])
+Material = namedtuple("Material", ["ambient", "diffuse", "specular", "shininess"],
+                      defaults=[(0.2, 0.2, 0.2), (0.8, 0.8, 0.8), (0.0, 0.0, 0.0), 0.0])
+
+VERTEX_SHADER_SRC = """
+#version 330 core
+layout (location = 0) in vec3 aPosition;
+layout (location = 1) in vec3 aNormal;
+
+uniform mat4 uProjection;
+uniform mat4 uModelView;
+uniform mat3 uNormalMatrix;
+
+out vec3 vEyePosition;
+out vec3 vNormal;
+
+void main() {
+    vec4 eye = uModelView * vec4(aPosition, 1.0);
+    vEyePosition = eye.xyz;
+    vNormal = uNormalMatrix * aNormal;
+    gl_Position = uProjection * eye;
+}
+"""
+
+FRAGMENT_SHADER_SRC = """
+#version 330 core
+in vec3 vEyePosition;
+in vec3 vNormal;
+
+uniform bool uLighting;
+uniform bool uColorMaterial;
+uniform vec4 uColor;
+uniform vec3 uGlobalAmbient;
+
+uniform vec4 uLightPosition;
+uniform vec3 uLightAmbient;
+uniform vec3 uLightDiffuse;
+uniform vec3 uLightSpecular;
+
+uniform vec3 uMaterialAmbient;
+uniform vec3 uMaterialDiffuse;
+uniform vec3 uMaterialSpecular;
+uniform float uShininess;
+
+out vec4 FragColor;
+
+void main() {
+    if (!uLighting) {
+        FragColor = uColor;
+        return;
+    }
+    // uColorMaterial повторяет GL_COLOR_MATERIAL с GL_AMBIENT_AND_DIFFUSE
+    vec3 ambient = uColorMaterial ? uColor.rgb : uMaterialAmbient;
+    vec3 diffuse = uColorMaterial ? uColor.rgb : uMaterialDiffuse;
+
+    vec3 n = normalize(vNormal);
+    vec3 l = uLightPosition.w == 0.0 ? normalize(uLightPosition.xyz)
+                                     : normalize(uLightPosition.xyz - vEyePosition);
+    float n_dot_l = max(dot(n, l), 0.0);
+    vec3 color = (uGlobalAmbient + uLightAmbient) * ambient + uLightDiffuse * diffuse * n_dot_l;
+    if (n_dot_l > 0.0) {
+        // Blinn: наблюдатель на бесконечности по +z, как при GL_LIGHT_MODEL_LOCAL_VIEWER = false
+        vec3 h = normalize(l + vec3(0.0, 0.0, 1.0));
+        color += uLightSpecular * uMaterialSpecular * pow(max(dot(n, h), 0.0), uShininess);
+    }
+    FragColor = vec4(min(color, vec3(1.0)), uColor.a);
+}
+"""
+
+
+class LightingProgram:
+    # vertex_shader_src можно подменить: шейдер обязан выдавать vEyePosition и vNormal
+    def __init__(self, light=Light(), material=Material(), global_ambient=(0.2, 0.2, 0.2),
+                 color_material=False, vertex_shader_src=VERTEX_SHADER_SRC):
+        self.program = shaders.compileProgram(
+            shaders.compileShader(vertex_shader_src, GL_VERTEX_SHADER),
+            shaders.compileShader(FRAGMENT_SHADER_SRC, GL_FRAGMENT_SHADER),
+        )
+        self.locations = {}
+        self.projection = None
+        self.model_view = None
+        self.color = None
+        self.lighting = None
+        self.floats = {}
+
+        glUseProgram(self.program)
+        glUniform3f(self._location("uGlobalAmbient"), *global_ambient)
+        glUniform1i(self._location("uColorMaterial"), int(color_material))
+        self.set_light(light)
+        self.set_material(material)
+        self.set_lighting(True)
+        self.set_color((1.0, 1.0, 1.0))
+        glUseProgram(0)
+
+    def _location(self, name):
+        location = self.locations.get(name)
+        if location is None:
+            location = glGetUniformLocation(self.program, name)
+            self.locations[name] = location
+        return location
+
+    def use(self):
+        glUseProgram(self.program)
+
+    def set_light(self, light):
+        glUniform4f(self._location("uLightPosition"), *light.position)
+        glUniform3f(self._location("uLightAmbient"), *light.ambient)
+        glUniform3f(self._location("uLightDiffuse"), *light.diffuse)
+        glUniform3f(self._location("uLightSpecular"), *light.specular)
+
+    def set_material(self, material):
+        glUniform3f(self._location("uMaterialAmbient"), *material.ambient)
+        glUniform3f(self._location("uMaterialDiffuse"), *material.diffuse)
+        glUniform3f(self._location("uMaterialSpecular"), *material.specular)
+        glUniform1f(self._location("uShininess"), material.shininess)
+
+    # Матрицы приходят из кэшей common.transforms, поэтому сравнение по identity
+    # отсекает повторную загрузку одних и тех же uniform-ов
+    def set_projection(self, matrix):
+        if matrix is not self.projection:
+            glUniformMatrix4fv(self._location("uProjection"), 1, GL_TRUE, matrix)
+            self.projection = matrix
+
+    def set_model_view(self, model_view):
+        if model_view is not self.model_view:
+            glUniformMatrix4fv(self._location("uModelView"), 1, GL_TRUE, model_view.matrix)
+            glUniformMatrix3fv(self._location("uNormalMatrix"), 1, GL_TRUE, model_view.normal_matrix)
+            self.model_view = model_view
+
+    def set_color(self, rgb, alpha=1.0):
+        color = (*rgb, alpha)
+        if color != self.color:
+            glUniform4f(self._location("uColor"), *color)
+            self.color = color
+
+    def set_float(self, name, value):
+        if self.floats.get(name) != value:
+            glUniform1f(self._location(name), value)
+            self.floats[name] = value
+
+    def set_lighting(self, enabled):
+        if enabled != self.lighting:
+            glUniform1i(self._location("uLighting"), int(enabled))
+            self.lighting = enabled
+
+    def delete(self):
+        glDeleteProgram(self.program)
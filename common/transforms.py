@@ -0,0 +1,113 @@
+import math
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+
+# Матрицы в обычной (строковой) записи numpy: v' = M @ v.
+# В GL их передают транспонированными: glLoadMatrixf(m.T) или glUniformMatrix4fv(..., GL_TRUE, m).
+
+def frozen(matrix):
+    matrix = np.array(matrix, dtype=np.float32)
+    matrix.flags.writeable = False
+    return matrix
+
+
+IDENTITY = frozen(np.eye(4))
+
+
+def compose(*matrices):
+    result = np.eye(4, dtype=np.float32)
+    for matrix in matrices:
+        result = result @ matrix
+    return frozen(result)
+
+
+@lru_cache(maxsize=256)
+def ortho(left, right, bottom, top, near, far):
+    m = np.eye(4)
+    m[0, 0] = 2.0 / (right - left)
+    m[1, 1] = 2.0 / (top - bottom)
+    m[2, 2] = -2.0 / (far - near)
+    m[0, 3] = -(right + left) / (right - left)
+    m[1, 3] = -(top + bottom) / (top - bottom)
+    m[2, 3] = -(far + near) / (far - near)
+    return frozen(m)
+
+
+@lru_cache(maxsize=256)
+def perspective(fovy_degs, aspect, near, far):
+    f = 1.0 / math.tan(math.radians(fovy_degs) / 2.0)
+    m = np.zeros((4, 4))
+    m[0, 0] = f / aspect
+    m[1, 1] = f
+    m[2, 2] = (far + near) / (near - far)
+    m[2, 3] = 2.0 * far * near / (near - far)
+    m[3, 2] = -1.0
+    return frozen(m)
+
+
+@lru_cache(maxsize=64)
+def look_at(eye, center, up):
+    eye = np.array(eye, dtype=np.float64)
+    forward = np.array(center, dtype=np.float64) - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, up)
+    side /= np.linalg.norm(side)
+    true_up = np.cross(side, forward)
+    m = np.eye(4)
+    m[0, :3] = side
+    m[1, :3] = true_up
+    m[2, :3] = -forward
+    m[:3, 3] = -m[:3, :3] @ eye
+    return frozen(m)
+
+
+@lru_cache(maxsize=64)
+def oblique_shear(angle_degs, scale):
+    # Та же раскладка, что и у списка S, который раньше уходил в glMultMatrixf (по столбцам)
+    rad = math.radians(angle_degs)
+    m = np.eye(4)
+    m[2, 0] = -scale * math.cos(rad)
+    m[2, 1] = -scale * math.sin(rad)
+    return frozen(m)
+
+
+def rotation(angle_degs, x, y, z):
+    norm = math.sqrt(x * x + y * y + z * z)
+    x, y, z = x / norm, y / norm, z / norm
+    rad = math.radians(angle_degs)
+    c, s = math.cos(rad), math.sin(rad)
+    t = 1.0 - c
+    return frozen([
+        [t * x * x + c,     t * x * y - s * z, t * x * z + s * y, 0.0],
+        [t * x * y + s * z, t * y * y + c,     t * y * z - s * x, 0.0],
+        [t * x * z - s * y, t * y * z + s * x, t * z * z + c,     0.0],
+        [0.0,               0.0,               0.0,               1.0],
+    ])
+
+
+@lru_cache(maxsize=256)
+def scale(sx, sy, sz):
+    return frozen(np.diag([sx, sy, sz, 1.0]))
+
+
+@lru_cache(maxsize=256)
+def translation(x, y, z):
+    m = np.eye(4)
+    m[:3, 3] = (x, y, z)
+    return frozen(m)
+
+
+def normal_matrix(model_view):
+    return frozen(np.linalg.inv(model_view[:3, :3]).T)
+
+
+ModelView = namedtuple("ModelView", ["matrix", "normal_matrix"])
+
+
+def model_view(*matrices):
+    matrix = compose(*matrices)
+    return ModelView(matrix, normal_matrix(matrix))
+
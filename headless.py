@@ -0,0 +1,384 @@
+import os
+
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+import abc
+import argparse
+import ctypes
+import importlib.util
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+from OpenGL import EGL
+from OpenGL.GL import (glGetString, glFinish, glPixelStorei, glReadPixels,
+                       GL_RENDERER, GL_VERSION, GL_PACK_ALIGNMENT, GL_RGB, GL_UNSIGNED_BYTE)
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Эталонные кадры встроенных сценариев; сняты на Mesa llvmpipe, на других драйверах нужен --tolerance
+GOLDEN_DIR = os.path.join(ROOT_DIR, "golden")
+
+
+class OffscreenContext:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("eglInitialize failed")
+
+        config_attribs = (EGL.EGLint * 15)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8,
+            EGL.EGL_GREEN_SIZE, 8,
+            EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_ALPHA_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE,
+        )
+        config = EGL.EGLConfig()
+        num_configs = EGL.EGLint()
+        if not EGL.eglChooseConfig(self.display, config_attribs, ctypes.pointer(config), 1,
+                                   ctypes.pointer(num_configs)) or num_configs.value == 0:
+            raise RuntimeError("No EGL config with an RGBA8/depth24 pbuffer")
+
+        surface_attribs = (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE)
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config, surface_attribs)
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        if not EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context):
+            raise RuntimeError("eglMakeCurrent failed")
+
+        print(f"Offscreen context {width}x{height}: "
+              f"{glGetString(GL_RENDERER).decode()} / {glGetString(GL_VERSION).decode()}")
+
+    def read_pixels(self):
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE)
+        pixels = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+        return np.ascontiguousarray(pixels[::-1])
+
+    def close(self):
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglTerminate(self.display)
+
+
+def load_lab(name):
+    path = os.path.join(ROOT_DIR, name, "main.py")
+    spec = importlib.util.spec_from_file_location(f"{name}_main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_png(path, pixels):
+    h, w, _ = pixels.shape
+    rows = np.hstack([np.zeros((h, 1), dtype=np.uint8), pixels.reshape(h, w * 3)])
+
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def read_png(path):
+    # Читает только то, что пишет write_png: RGB8 без фильтров строк
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError(f"{path}: not a PNG file")
+    pos, idat, header = 8, [], None
+    while pos < len(data):
+        length, tag = struct.unpack(">I4s", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        if tag == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif tag == b"IDAT":
+            idat.append(body)
+        pos += 12 + length
+    w, h, depth, color_type = header[:4]
+    if depth != 8 or color_type != 2:
+        raise ValueError(f"{path}: only 8-bit RGB PNGs are supported")
+    rows = np.frombuffer(zlib.decompress(b"".join(idat)), dtype=np.uint8).reshape(h, 1 + w * 3)
+    if rows[:, 0].any():
+        raise ValueError(f"{path}: filtered PNG rows are not supported")
+    return rows[:, 1:].reshape(h, w, 3)
+
+
+class LabDriver(abc.ABC):
+    size = (800, 600)
+    default_script = "frames 10"
+
+    def __init__(self, lab, width, height):
+        self.lab = lab
+        self.width = width
+        self.height = height
+
+    def setup(self):
+        pass
+
+    def key(self, name):
+        raise ValueError(f"{type(self).__name__} has no keyboard input")
+
+    def special(self, name):
+        raise ValueError(f"{type(self).__name__} has no special keys")
+
+    def click(self, x, y):
+        raise ValueError(f"{type(self).__name__} has no mouse input")
+
+    @abc.abstractmethod
+    def render(self):
+        pass
+
+
+class GlutLabDriver(LabDriver):
+    def __init__(self, lab, width, height):
+        super().__init__(lab, width, height)
+        # Без окна GLUT эти вызовы не нужны, а freeglut без glutInit завершает процесс
+        lab.glutSwapBuffers = lambda: None
+        lab.glutPostRedisplay = lambda: None
+        lab.glutSetWindowTitle = lambda title: None
+        lab.glutTimerFunc = lambda msecs, func, value: None
+
+    def key(self, name):
+        key = {"esc": b"\x1b", "space": b" "}.get(name.lower(), name.encode())
+        self.lab.keyboard(key, 0, 0)
+
+    def special(self, name):
+        self.lab.special_keys(getattr(self.lab, f"GLUT_KEY_{name.upper()}"), 0, 0)
+
+    def render(self):
+        self.lab.display()
+
+
+class GlfwLabDriver(LabDriver):
+    def glfw_key(self, name):
+        return getattr(self.lab.glfw, f"KEY_{name.upper()}")
+
+
+class Lab1Driver(GlfwLabDriver):
+    size = (600, 600)
+    default_script = "frames 1\nkey space\nframes 1\nkey space\nkey space\nframes 1"
+
+    def key(self, name):
+        self.lab.key_callback(None, self.glfw_key(name), 0, self.lab.glfw.PRESS, 0)
+
+    def render(self):
+        self.lab.display()
+
+
+class Lab2Driver(GlutLabDriver):
+    default_script = ("frames 1\nspecial up\nspecial right\nframes 1\n"
+                      "key +\nframes 1\nkey m\nframes 1")
+
+    def setup(self):
+        self.lab.init()
+        self.lab.reshape(self.width, self.height)
+
+
+class Lab3Driver(GlutLabDriver):
+    default_script = "frames 5\nkey v\nframes 5"
+
+    def setup(self):
+        # Фиксированный шаг анимации, чтобы кадры не зависели от скорости машины
+        self.lab.fixed_timestep = 1.0 / 60.0
+        self.lab.init_gl()
+        self.lab.reshape(self.width, self.height)
+
+
+class Lab4Driver(GlfwLabDriver):
+    default_script = ("click 100 100\nclick 600 150\nclick 500 500\nclick 150 400\nframes 1\n"
+                      "key f\nframes 1")
+
+    def setup(self):
+        self.app = self.lab.RasterizerApp(self.width, self.height, create_window=False)
+        self.app.log_uploads = False
+
+    def key(self, name):
+        self.app._key_callback(None, self.glfw_key(name), 0, self.lab.glfw.PRESS, 0)
+
+    def click(self, x, y):
+        self.app.app_state.add_vertex(x, y, self.lab.LINE_COLOR_RGB)
+
+    def render(self):
+        if self.app.app_state.needs_buffer_update:
+            self.app._update_texture()
+        self.app.render()
+
+
+class Lab5Driver(GlutLabDriver):
+    default_script = "click 200 150\nclick 600 450\nframes 1\nclick 100 500\nclick 700 100\nframes 1"
+
+    def setup(self):
+        self.lab.glClearColor(1, 1, 1, 1)
+        self.lab.reshape(self.width, self.height)
+
+    def click(self, x, y):
+        self.lab.mouse(self.lab.GLUT_LEFT_BUTTON, self.lab.GLUT_DOWN, x, y)
+
+
+DRIVERS = {
+    "lab1": Lab1Driver,
+    "lab2": Lab2Driver,
+    "lab3": Lab3Driver,
+    "lab4": Lab4Driver,
+    "lab5": Lab5Driver,
+}
+
+
+def parse_script(text):
+    steps = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        tokens = line.split("#", 1)[0].split()
+        if not tokens:
+            continue
+        command, args = tokens[0].lower(), tokens[1:]
+        if command == "frames" and len(args) == 1:
+            steps.append(("frames", int(args[0])))
+        elif command in ("key", "special") and len(args) == 1:
+            steps.append((command, args[0]))
+        elif command == "click" and len(args) == 2:
+            steps.append(("click", float(args[0]), float(args[1])))
+        else:
+            raise ValueError(f"Script line {line_no}: cannot parse {line.strip()!r}")
+    return steps
+
+
+def run_script(driver, context, steps, out_dir=None):
+    frames = []
+    timings = []
+    for step in steps:
+        if step[0] == "key":
+            driver.key(step[1])
+        elif step[0] == "special":
+            driver.special(step[1])
+        elif step[0] == "click":
+            driver.click(step[1], step[2])
+        else:
+            for _ in range(step[1]):
+                start = time.perf_counter()
+                driver.render()
+                glFinish()
+                timings.append(time.perf_counter() - start)
+                frames.append(context.read_pixels())
+
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        for index, pixels in enumerate(frames):
+            write_png(os.path.join(out_dir, f"frame_{index:04d}.png"), pixels)
+        with open(os.path.join(out_dir, "timings.csv"), "w") as f:
+            f.write("frame,ms\n")
+            for index, seconds in enumerate(timings):
+                f.write(f"{index},{seconds * 1000:.3f}\n")
+    return frames, timings
+
+
+def compare_with_golden(frames, golden_dir, tolerance):
+    failures = 0
+    for index, pixels in enumerate(frames):
+        path = os.path.join(golden_dir, f"frame_{index:04d}.png")
+        if not os.path.exists(path):
+            print(f"frame {index}: no golden image at {path}")
+            failures += 1
+            continue
+        golden = read_png(path)
+        if golden.shape != pixels.shape:
+            print(f"frame {index}: size {pixels.shape[1]}x{pixels.shape[0]}, "
+                  f"golden {golden.shape[1]}x{golden.shape[0]}")
+            failures += 1
+            continue
+        diff = np.abs(golden.astype(np.int16) - pixels).max(axis=2)
+        bad = int((diff > tolerance).sum())
+        if bad:
+            print(f"frame {index}: {bad} pixels differ by more than {tolerance} (max {diff.max()})")
+            failures += 1
+    print(f"Golden comparison: {len(frames) - failures}/{len(frames)} frames match")
+    return failures == 0
+
+
+def run_lab(name, args, parser):
+    driver_class = DRIVERS[name]
+    width = args.width or driver_class.size[0]
+    height = args.height or driver_class.size[1]
+
+    context = OffscreenContext(width, height)
+    try:
+        lab = load_lab(name)
+        if args.bench:
+            if not hasattr(lab, "benchmark_render"):
+                parser.error(f"{name} has no benchmark_render(); --bench is not available for it")
+            lab.benchmark_render(args.frames, width, height)
+            return True
+
+        if args.script:
+            with open(args.script) as f:
+                steps = parse_script(f.read())
+        else:
+            steps = parse_script(driver_class.default_script)
+        driver = driver_class(lab, width, height)
+        driver.setup()
+        out_dir = os.path.join(args.out, name) if args.out and args.lab == "all" else args.out
+        frames, timings = run_script(driver, context, steps, out_dir)
+
+        if timings:
+            ms = np.array(timings) * 1000
+            print(f"{name}: {len(ms)} frames, mean {ms.mean():.2f} ms, "
+                  f"p50 {np.percentile(ms, 50):.2f} ms, p95 {np.percentile(ms, 95):.2f} ms")
+        golden_dir = args.golden or os.path.join(GOLDEN_DIR, name)
+        if args.update_golden:
+            os.makedirs(golden_dir, exist_ok=True)
+            for index, pixels in enumerate(frames):
+                write_png(os.path.join(golden_dir, f"frame_{index:04d}.png"), pixels)
+            print(f"{name}: {len(frames)} golden frames written to {golden_dir}")
+            return True
+        if args.golden is not None:
+            return compare_with_golden(frames, golden_dir, args.tolerance)
+        return True
+    finally:
+        context.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run labs in an offscreen EGL context")
+    parser.add_argument("lab", choices=sorted(DRIVERS) + ["all"],
+                        help="lab to run; 'all' checks every lab against its golden frames")
+    parser.add_argument("--script", help="input script file (default: built-in script of the lab)")
+    parser.add_argument("--out", help="directory for captured frames and timings.csv")
+    parser.add_argument("--golden", nargs="?", const="",
+                        help="compare with golden frames (default directory: golden/<lab>)")
+    parser.add_argument("--update-golden", action="store_true",
+                        help="write the captured frames as the new golden frames")
+    parser.add_argument("--tolerance", type=int, default=0, help="allowed per-channel difference")
+    parser.add_argument("--bench", action="store_true", help="run the lab's benchmark_render()")
+    parser.add_argument("--frames", type=int, default=200, help="frames for --bench")
+    parser.add_argument("--width", type=int)
+    parser.add_argument("--height", type=int)
+    args = parser.parse_args()
+
+    if args.lab != "all":
+        return 0 if run_lab(args.lab, args, parser) else 1
+    if args.bench or args.script:
+        parser.error("'all' runs the built-in scripts; --bench and --script need a single lab")
+    if args.golden is None:
+        args.golden = ""
+    failed = [name for name in sorted(DRIVERS) if not run_lab(name, args, parser)]
+    if failed:
+        print("Golden check failed:", ", ".join(failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,203 @@
 import glfw
 import numpy as np
 import OpenGL.GL as gl
+from OpenGL.GL import shaders
+import ctypes
 import math
+import time
 
 rotation_angle = 0.0
+num_points = 7
+radius_outer = 0.5
+radius_inner = 0.2
+use_vbo = True
+star_geometries = {}
+field_mode = False
+field_size = 100000
+star_field = None
+
+STAR_FIELD_VERTEX_SHADER_SRC = """
+#version 330 core
+layout (location = 0) in vec2 aPos;
+layout (location = 1) in vec2 aOffset;
+layout (location = 2) in float aScale;
+layout (location = 3) in float aRotation;
+layout (location = 4) in vec3 aColor;
+
+uniform float uGlobalRotation;
+uniform float uOutline;
+
+out vec3 vColor;
+
+void main()
+{
+    float a = radians(aRotation + uGlobalRotation);
+    mat2 rotation = mat2(cos(a), sin(a), -sin(a), cos(a));
+    gl_Position = vec4(aOffset + rotation * (aPos * aScale), 0.0, 1.0);
+    vColor = mix(aColor, vec3(1.0), uOutline);
+}
+"""
+
+STAR_FIELD_FRAGMENT_SHADER_SRC = """
+#version 330 core
+in vec3 vColor;
+out vec4 FragColor;
+
+void main()
+{
+    FragColor = vec4(vColor, 1.0);
+}
+"""
 
 def key_callback(window, key, scancode, action, mods):
-    global rotation_angle
-    if key == glfw.KEY_SPACE and action == glfw.PRESS:
+    global rotation_angle, use_vbo, field_mode, field_size
+    if action != glfw.PRESS:
+        return
+    if key == glfw.KEY_SPACE:
         rotation_angle += 10
+    elif key == glfw.KEY_V:
+        use_vbo = not use_vbo
+        print("Star path:", "vbo" if use_vbo else "immediate")
+    elif key == glfw.KEY_F:
+        field_mode = not field_mode
+        print("Star field:", f"{field_size} stars" if field_mode else "off")
+    elif key == glfw.KEY_S and star_field is not None:
+        star_field.spin()
+    elif key in (glfw.KEY_EQUAL, glfw.KEY_KP_ADD):
+        field_size *= 2
+        print(f"Star field size: {field_size}")
+    elif key in (glfw.KEY_MINUS, glfw.KEY_KP_SUBTRACT):
+        field_size = max(1, field_size // 2)
+        print(f"Star field size: {field_size}")
 
-def draw_star():
-    global rotation_angle
+def build_star_vertices(num_points, radius_outer, radius_inner):
+    i = np.arange(num_points * 2)
+    angle = np.pi / 2 - (i * np.pi / num_points)
+    r = np.where(i % 2 == 0, radius_outer, radius_inner)
+    return np.stack([r * np.cos(angle), r * np.sin(angle)], axis=1).astype(np.float32)
+
+class StarGeometry:
+    def __init__(self, num_points, radius_outer, radius_inner):
+        outline = build_star_vertices(num_points, radius_outer, radius_inner)
+        # Веер из центра по всем вершинам контура плюс замыкающая вершина, затем сам контур
+        fan = np.vstack([[0.0, 0.0], outline, outline[:1]]).astype(np.float32)
+        vertices = np.ascontiguousarray(np.vstack([fan, outline]))
+        self.fan_count = len(fan)
+        self.outline_first = len(fan)
+        self.outline_count = len(outline)
+
+        self.vbo = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, vertices.nbytes, vertices, gl.GL_STATIC_DRAW)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glVertexPointer(2, gl.GL_FLOAT, 0, None)
+
+        gl.glColor3f(1.0, 0.5, 0.0)
+        gl.glDrawArrays(gl.GL_TRIANGLE_FAN, 0, self.fan_count)
+        gl.glColor3f(1.0, 1.0, 1.0)
+        gl.glDrawArrays(gl.GL_LINE_LOOP, self.outline_first, self.outline_count)
+
+        gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def delete(self):
+        gl.glDeleteBuffers(1, [self.vbo])
+
+def get_star_geometry(num_points, radius_outer, radius_inner):
+    key = (num_points, radius_outer, radius_inner)
+    if key not in star_geometries:
+        star_geometries[key] = StarGeometry(num_points, radius_outer, radius_inner)
+    return star_geometries[key]
+
+class StarField:
+    # Атрибуты экземпляра: смещение (2), масштаб, поворот в градусах, цвет (3)
+    FLOATS_PER_INSTANCE = 7
+
+    def __init__(self, count, geometry, seed=0):
+        rng = np.random.default_rng(seed)
+        self.count = count
+        self.geometry = geometry
+        self.instances = np.empty((count, self.FLOATS_PER_INSTANCE), dtype=np.float32)
+        self.positions = self.instances[:, 0:2]
+        self.scales = self.instances[:, 2]
+        self.rotations = self.instances[:, 3]
+        self.colors = self.instances[:, 4:7]
+        self.positions[:] = rng.uniform(-1.0, 1.0, (count, 2))
+        self.scales[:] = rng.uniform(0.005, 0.03, count)
+        self.rotations[:] = rng.uniform(0.0, 360.0, count)
+        self.colors[:] = rng.uniform(0.3, 1.0, (count, 3))
+        self.spin_speeds = rng.uniform(-30.0, 30.0, count).astype(np.float32)
+
+        self.program = shaders.compileProgram(
+            shaders.compileShader(STAR_FIELD_VERTEX_SHADER_SRC, gl.GL_VERTEX_SHADER),
+            shaders.compileShader(STAR_FIELD_FRAGMENT_SHADER_SRC, gl.GL_FRAGMENT_SHADER))
+        self.global_rotation_loc = gl.glGetUniformLocation(self.program, "uGlobalRotation")
+        self.outline_loc = gl.glGetUniformLocation(self.program, "uOutline")
+
+        self.vao = gl.glGenVertexArrays(1)
+        self.instance_vbo = gl.glGenBuffers(1)
+        gl.glBindVertexArray(self.vao)
+
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, geometry.vbo)
+        gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
+        gl.glEnableVertexAttribArray(0)
+
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.instance_vbo)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, self.instances.nbytes, self.instances, gl.GL_DYNAMIC_DRAW)
+        stride = self.FLOATS_PER_INSTANCE * ctypes.sizeof(gl.GLfloat)
+        for location, size, offset in ((1, 2, 0), (2, 1, 2), (3, 1, 3), (4, 3, 4)):
+            gl.glVertexAttribPointer(location, size, gl.GL_FLOAT, gl.GL_FALSE, stride,
+                                     ctypes.c_void_p(offset * ctypes.sizeof(gl.GLfloat)))
+            gl.glEnableVertexAttribArray(location)
+            gl.glVertexAttribDivisor(location, 1)
+
+        gl.glBindVertexArray(0)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def upload(self):
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.instance_vbo)
+        gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, self.instances.nbytes, self.instances)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
 
+    def spin(self, seconds=1.0):
+        self.rotations += self.spin_speeds * seconds
+        np.remainder(self.rotations, 360.0, out=self.rotations)
+        self.upload()
+
+    def draw(self, global_rotation=0.0):
+        gl.glUseProgram(self.program)
+        gl.glUniform1f(self.global_rotation_loc, global_rotation)
+        gl.glBindVertexArray(self.vao)
+
+        gl.glUniform1f(self.outline_loc, 0.0)
+        gl.glDrawArraysInstanced(gl.GL_TRIANGLE_FAN, 0, self.geometry.fan_count, self.count)
+        gl.glUniform1f(self.outline_loc, 1.0)
+        gl.glDrawArraysInstanced(gl.GL_LINE_LOOP, self.geometry.outline_first,
+                                 self.geometry.outline_count, self.count)
+
+        gl.glBindVertexArray(0)
+        gl.glUseProgram(0)
+
+    def delete(self):
+        gl.glDeleteVertexArrays(1, [self.vao])
+        gl.glDeleteBuffers(1, [self.instance_vbo])
+        gl.glDeleteProgram(self.program)
+
+def get_star_field():
+    global star_field
+    geometry = get_star_geometry(num_points, radius_outer, radius_inner)
+    if star_field is None or star_field.count != field_size or star_field.geometry is not geometry:
+        if star_field is not None:
+            star_field.delete()
+        star_field = StarField(field_size, geometry)
+    return star_field
+
+def draw_star_immediate():
     vertices = []
-    num_points = 7
-    radius_outer = 0.5
-    radius_inner = 0.2
 
     for i in range(num_points * 2):
         angle = math.pi / 2 - (i * math.pi / num_points)
@@ -27,9 +208,6 @@ def draw_star():
 
     vertices = np.array(vertices, dtype=np.float32)
 
-    gl.glPushMatrix()
-    gl.glRotatef(rotation_angle, 0, 0, 1)
-
     gl.glBegin(gl.GL_TRIANGLES)
     gl.glColor3f(1.0, 0.5, 0.0)
 
@@ -48,8 +226,72 @@ def draw_star():
 
     gl.glEnd()
 
+def draw_star():
+    gl.glPushMatrix()
+    gl.glRotatef(rotation_angle, 0, 0, 1)
+
+    if use_vbo:
+        get_star_geometry(num_points, radius_outer, radius_inner).draw()
+    else:
+        draw_star_immediate()
+
     gl.glPopMatrix()
 
+def display():
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+    gl.glLoadIdentity()
+
+    if field_mode:
+        get_star_field().draw(rotation_angle)
+    else:
+        draw_star()
+
+def benchmark_star_paths(frames=200, point_counts=(7, 100, 1000, 10000)):
+    global num_points, use_vbo
+    saved = num_points, use_vbo
+    for count in point_counts:
+        num_points = count
+        times = {}
+        for path in ("immediate", "vbo"):
+            use_vbo = path == "vbo"
+            display()
+            gl.glFinish()
+            start = time.perf_counter()
+            for _ in range(frames):
+                display()
+                gl.glFinish()
+            times[path] = (time.perf_counter() - start) / frames
+        print(f"num_points={count}: immediate {times['immediate'] * 1000:.3f} ms/frame, "
+              f"vbo {times['vbo'] * 1000:.3f} ms/frame, speedup x{times['immediate'] / times['vbo']:.1f}")
+    num_points, use_vbo = saved
+
+def benchmark_star_field(frames=50, counts=(1000, 10000, 100000, 1000000)):
+    global field_mode, field_size
+    saved = field_mode, field_size
+    field_mode = True
+    for count in counts:
+        field_size = count
+        field = get_star_field()
+        display()
+        gl.glFinish()
+        start = time.perf_counter()
+        for _ in range(frames):
+            display()
+            gl.glFinish()
+        draw_time = (time.perf_counter() - start) / frames
+
+        start = time.perf_counter()
+        field.spin(1.0 / 60.0)
+        update_time = time.perf_counter() - start
+        print(f"{count} instances: draw {draw_time * 1000:.2f} ms/frame, "
+              f"bulk rotation update {update_time * 1000:.2f} ms")
+    field_mode, field_size = saved
+
+def benchmark_render(frames=200, width=600, height=600):
+    gl.glViewport(0, 0, width, height)
+    benchmark_star_paths(frames)
+    benchmark_star_field(max(1, frames // 4))
+
 def main():
     if not glfw.init():
         return
@@ -60,17 +302,19 @@ def main():
         return
 
     glfw.make_context_current(window)
+    glfw.swap_interval(1)
     glfw.set_key_callback(window, key_callback)
 
     while not glfw.window_should_close(window):
-        gl.glClear(gl.GL_COLOR_BUFFER_BIT)
-        gl.glLoadIdentity()
-
-        draw_star()
+        display()
 
         glfw.swap_buffers(window)
         glfw.poll_events()
 
+    if star_field is not None:
+        star_field.delete()
+    for geometry in star_geometries.values():
+        geometry.delete()
     glfw.terminate()
 
 if __name__ == "__main__":
@@ -1,9 +1,15 @@
+import os
 import sys
-import math
+import ctypes
+from functools import lru_cache
+import numpy as np
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import lighting, transforms
+
 interactive_angle_x = 0.0
 interactive_angle_y = 0.0
 scale_factor = 1.0
@@ -11,69 +17,191 @@ scale_factor = 1.0
 wireframe_mode = False
 front_is_ccw = True
 
-def draw_cube():
-    vertices = [
-        [-1.0, -1.0, -1.0],
-        [ 1.0, -1.0, -1.0],
-        [ 1.0,  1.0, -1.0],
-        [-1.0,  1.0, -1.0],
-        [-1.0, -1.0,  1.0],
-        [ 1.0, -1.0,  1.0],
-        [ 1.0,  1.0,  1.0],
-        [-1.0,  1.0,  1.0],
-    ]
-    faces = [
-        [0, 1, 2, 3],
-        [4, 5, 6, 7],
-        [0, 1, 5, 4],
-        [2, 3, 7, 6],
-        [1, 2, 6, 5],
-        [0, 3, 7, 4],
-    ]
-
-    glBegin(GL_QUADS)
-    for face in faces:
-        for v in face:
-            glVertex3fv(vertices[v])
-    glEnd()
-
-    if not wireframe_mode:
-        glDisable(GL_LIGHTING)
-        glColor3f(0, 0, 0)
-        glLineWidth(2.0)
-        for face in faces:
-            glBegin(GL_LINE_LOOP)
-            for v in face:
-                glVertex3fv(vertices[v])
-            glEnd()
+use_shaders = True
+lighting_program = None
+projection_matrix = transforms.IDENTITY
+
+OBLIQUE_ANGLE = 45.0
+OBLIQUE_SCALE = 0.5
+CUBE_LIGHT = lighting.Light(position=(10.0, 10.0, 10.0, 1.0))
+SECOND_CUBE_MODEL_VIEW = transforms.model_view(transforms.translation(2.5, 0.0, -5.0))
+
+CUBE_VERTICES = [
+    [-1.0, -1.0, -1.0],
+    [ 1.0, -1.0, -1.0],
+    [ 1.0,  1.0, -1.0],
+    [-1.0,  1.0, -1.0],
+    [-1.0, -1.0,  1.0],
+    [ 1.0, -1.0,  1.0],
+    [ 1.0,  1.0,  1.0],
+    [-1.0,  1.0,  1.0],
+]
+CUBE_FACES = [
+    [0, 1, 2, 3],
+    [4, 5, 6, 7],
+    [0, 1, 5, 4],
+    [2, 3, 7, 6],
+    [1, 2, 6, 5],
+    [0, 3, 7, 4],
+]
+
+cube_mesh = None
+# Грани — пары треугольников (GL_QUADS в core profile нет), с тем же разбиением, что у драйвера.
+# Каркас — рёбра каждой грани её же вершинами, как glPolygonMode(GL_LINE) рисовал четырёхугольник
+QUAD_TRIANGLES = (0, 1, 3, 1, 2, 3)
+QUAD_OUTLINE = (0, 1, 1, 2, 2, 3, 3, 0)
+
+
+class CubeMesh:
+    def __init__(self):
+        corners = np.array(CUBE_VERTICES, dtype=np.float32)
+        faces = np.array(CUBE_FACES)
+        positions = corners[faces]
+        # Центр грани куба [-1, 1]^3 и есть её единичная внешняя нормаль
+        normals = np.repeat(positions.mean(axis=1, keepdims=True), 4, axis=1)
+        vertices = np.concatenate([positions, normals], axis=2).reshape(-1, 6)
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+
+        quads = np.arange(len(self.vertices), dtype=np.uint32).reshape(-1, 4)
+        self.face_indices = np.ascontiguousarray(quads[:, QUAD_TRIANGLES]).ravel()
+        self.outline_indices = np.ascontiguousarray(quads[:, QUAD_OUTLINE]).ravel()
+        edges = set()
+        for face in CUBE_FACES:
+            for k in range(4):
+                a, b = face[k], face[(k + 1) % 4]
+                if (b, a) not in edges and (a, b) not in edges:
+                    edges.add((a, b))
+        first_slot = {}
+        for slot, corner in enumerate(faces.ravel()):
+            first_slot.setdefault(int(corner), slot)
+        self.edge_indices = np.array([[first_slot[a], first_slot[b]] for a, b in sorted(edges)],
+                                     dtype=np.uint32).ravel()
+
+        self.vbo, self.face_ibo, self.outline_ibo, self.edge_ibo = glGenBuffers(4)
+        stride = 6 * self.vertices.itemsize
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.edge_ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.edge_indices.nbytes, self.edge_indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.face_ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.face_indices.nbytes, self.face_indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.outline_ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.outline_indices.nbytes, self.outline_indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+        # Для шейдеров только generic-атрибуты; клиентские массивы fixed-function — в своём VAO
+        self.vao, self.fixed_vao = glGenVertexArrays(2)
+        glBindVertexArray(self.vao)
+        glEnableVertexAttribArray(lighting.POSITION_LOCATION)
+        glVertexAttribPointer(lighting.POSITION_LOCATION, 3, GL_FLOAT, GL_FALSE, stride, None)
+        glEnableVertexAttribArray(lighting.NORMAL_LOCATION)
+        glVertexAttribPointer(lighting.NORMAL_LOCATION, 3, GL_FLOAT, GL_FALSE, stride,
+                              ctypes.c_void_p(3 * self.vertices.itemsize))
+        glBindVertexArray(self.fixed_vao)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, stride, None)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glNormalPointer(GL_FLOAT, stride, ctypes.c_void_p(3 * self.vertices.itemsize))
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def _draw(self, mode, ibo, count, shaders):
+        glBindVertexArray(self.vao if shaders else self.fixed_vao)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ibo)
+        glDrawElements(mode, count, GL_UNSIGNED_INT, None)
+        glBindVertexArray(0)
+
+    def draw_faces(self, shaders=False):
+        self._draw(GL_TRIANGLES, self.face_ibo, len(self.face_indices), shaders)
+
+    def draw_outlines(self, shaders=False):
+        self._draw(GL_LINES, self.outline_ibo, len(self.outline_indices), shaders)
+
+    def draw_edges(self, shaders=False):
+        self._draw(GL_LINES, self.edge_ibo, len(self.edge_indices), shaders)
+
+    def delete(self):
+        glDeleteVertexArrays(2, [self.vao, self.fixed_vao])
+        glDeleteBuffers(4, [self.vbo, self.face_ibo, self.outline_ibo, self.edge_ibo])
+
+
+@lru_cache(maxsize=64)
+def oblique_projection(width, height):
+    aspect = width / float(height)
+    if width <= height:
+        ortho = transforms.ortho(-3, 3, -3 / aspect, 3 / aspect, 0.1, 100.0)
+    else:
+        ortho = transforms.ortho(-3 * aspect, 3 * aspect, -3, 3, 0.1, 100.0)
+    return transforms.compose(ortho, transforms.oblique_shear(OBLIQUE_ANGLE, OBLIQUE_SCALE))
+
+
+@lru_cache(maxsize=256)
+def cube_model_view(angle_x, angle_y, scale):
+    return transforms.model_view(
+        transforms.translation(0.0, 0.0, -5.0),
+        transforms.rotation(angle_x, 1, 0, 0),
+        transforms.rotation(angle_y, 0, 1, 0),
+        transforms.scale(scale, scale, scale),
+    )
+
+
+def set_color(r, g, b):
+    if use_shaders:
+        lighting_program.set_color((r, g, b))
+    else:
+        glColor3f(r, g, b)
+
+
+def set_lighting(enabled):
+    if use_shaders:
+        lighting_program.set_lighting(enabled)
+    elif enabled:
         glEnable(GL_LIGHTING)
+    else:
+        glDisable(GL_LIGHTING)
+
+
+def load_model_view(model_view):
+    if use_shaders:
+        lighting_program.set_model_view(model_view)
+    else:
+        glMatrixMode(GL_MODELVIEW)
+        glLoadMatrixf(model_view.matrix.T)
 
-def display():
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-    glMatrixMode(GL_MODELVIEW)
-    glLoadIdentity()
 
-    glTranslatef(0.0, 0.0, -5.0)
+def draw_cube():
+    if wireframe_mode:
+        cube_mesh.draw_outlines(use_shaders)
+        return
+    cube_mesh.draw_faces(use_shaders)
 
-    glRotatef(interactive_angle_x, 1, 0, 0)
-    glRotatef(interactive_angle_y, 0, 1, 0)
-    glScalef(scale_factor, scale_factor, scale_factor)
+    set_lighting(False)
+    set_color(0, 0, 0)
+    glLineWidth(2.0)
+    cube_mesh.draw_edges(use_shaders)
+    set_lighting(True)
 
-    glColor3f(0.0, 0.8, 0.0)
+def display():
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    if use_shaders:
+        lighting_program.use()
+        lighting_program.set_projection(projection_matrix)
+
+    load_model_view(cube_model_view(interactive_angle_x, interactive_angle_y, scale_factor))
+    set_color(0.0, 0.8, 0.0)
     draw_cube()
 
-    glPushMatrix()
-    glLoadIdentity()
-    glTranslatef(2.5, 0.0, -5.0)
-    glColor3f(0.8, 0.0, 0.0)
+    load_model_view(SECOND_CUBE_MODEL_VIEW)
+    set_color(0.8, 0.0, 0.0)
     draw_cube()
-    glPopMatrix()
 
+    if use_shaders:
+        glUseProgram(0)
     glutSwapBuffers()
 
 def keyboard(key, x, y):
     global scale_factor, wireframe_mode, interactive_angle_x, interactive_angle_y
-    global front_is_ccw
+    global front_is_ccw, use_shaders
 
     if isinstance(key, bytes):
         key = key.decode("utf-8", "ignore")
@@ -85,10 +213,6 @@ def keyboard(key, x, y):
 
     elif key.lower() == 'm':
         wireframe_mode = not wireframe_mode
-        if wireframe_mode:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
-        else:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
 
     elif key.lower() == 'f':
         front_is_ccw = not front_is_ccw
@@ -97,6 +221,11 @@ def keyboard(key, x, y):
         else:
             glFrontFace(GL_CW)
 
+    elif key.lower() == 's' and lighting_program is not None:
+        use_shaders = not use_shaders
+        load_projection()
+        print("Pipeline:", "shaders" if use_shaders else "fixed-function")
+
     elif key.lower() == 'r':
         interactive_angle_x = 0.0
         interactive_angle_y = 0.0
@@ -120,16 +249,20 @@ def special_keys(key, x, y):
     glutPostRedisplay()
 
 def init():
+    global cube_mesh, lighting_program, use_shaders
     glClearColor(0.9, 0.9, 0.9, 1.0)
     glEnable(GL_DEPTH_TEST)
     glShadeModel(GL_SMOOTH)
+    # Нормали масштабируются вместе с кубом (glScalef), их нужно перенормировать
+    glEnable(GL_NORMALIZE)
 
     glEnable(GL_LIGHTING)
     glEnable(GL_LIGHT0)
-    light_pos = [10.0, 10.0, 10.0, 1.0]
-    glLightfv(GL_LIGHT0, GL_POSITION, light_pos)
-    glLightfv(GL_LIGHT0, GL_DIFFUSE,  [1.0, 1.0, 1.0, 1.0])
-    glLightfv(GL_LIGHT0, GL_SPECULAR, [1.0, 1.0, 1.0, 1.0])
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    glLightfv(GL_LIGHT0, GL_POSITION, CUBE_LIGHT.position)
+    glLightfv(GL_LIGHT0, GL_DIFFUSE,  [*CUBE_LIGHT.diffuse, 1.0])
+    glLightfv(GL_LIGHT0, GL_SPECULAR, [*CUBE_LIGHT.specular, 1.0])
     glEnable(GL_COLOR_MATERIAL)
     glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
 
@@ -137,34 +270,28 @@ def init():
     glEnable(GL_LINE_SMOOTH)
     glHint(GL_LINE_SMOOTH_HINT, GL_NICEST)
 
+    cube_mesh = CubeMesh()
+    if use_shaders:
+        try:
+            lighting_program = lighting.LightingProgram(CUBE_LIGHT, color_material=True)
+        except (GLError, RuntimeError) as e:
+            print("Shader pipeline unavailable, using fixed-function:", e)
+            use_shaders = False
+
+def load_projection():
+    # В шейдерном режиме матрица уходит uniform-ом в display(), и только если изменилась
+    if not use_shaders:
+        glMatrixMode(GL_PROJECTION)
+        glLoadMatrixf(projection_matrix.T)
+        glMatrixMode(GL_MODELVIEW)
+
 def reshape(width, height):
+    global projection_matrix
     if height == 0:
         height = 1
     glViewport(0, 0, width, height)
-
-    glMatrixMode(GL_PROJECTION)
-    glLoadIdentity()
-
-    aspect = width / float(height)
-    if width <= height:
-        glOrtho(-3, 3, -3/aspect, 3/aspect, 0.1, 100.0)
-    else:
-        glOrtho(-3*aspect, 3*aspect, -3, 3, 0.1, 100.0)
-
-    angle_degs = 45.0
-    scale = 0.5
-    rad = math.radians(angle_degs)
-    sx = -scale * math.cos(rad)
-    sy = -scale * math.sin(rad)
-    S = [
-        1.0, 0.0, sx, 0.0,
-        0.0, 1.0, sy, 0.0,
-        0.0, 0.0, 1.0, 0.0,
-        0.0, 0.0, 0.0, 1.0
-    ]
-    glMultMatrixf(S)
-
-    glMatrixMode(GL_MODELVIEW)
+    projection_matrix = oblique_projection(width, height)
+    load_projection()
 
 def main():
     glutInit(sys.argv)
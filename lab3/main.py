@@ -1,16 +1,99 @@
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
+from OpenGL.error import NullFunctionError
+from collections import deque, namedtuple
+from functools import lru_cache
+import ctypes
+import numpy as np
 import math
+import os
 import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import lighting, transforms
 
 R = 1.0
 r = 0.3
 n_major = 100
 n_minor = 60
 twist = 0.0
+animate_twist = False
+TWIST_STEP = 0.5
+TWIST_AMPLITUDE = 2.0
+TWIST_SPEED = 1.5
 
 angle = 0.0
+animation_time = 0.0
+# 30°/с — прежние 0.5° за кадр при 60 к/с, но теперь не зависит от частоты кадров
+ROTATION_SPEED = 30.0
+
+target_fps = 60.0
+vsync = False
+fixed_timestep = None
+last_frame_time = None
+next_frame_deadline = None
+frame_timer_pending = False
+last_title_update = 0.0
+gpu_timer = None
+zoom = 1.0
+viewport_height = 600
+
+use_vbo = True
+torus_vbos = {}
+
+use_lod = True
+# От самого подробного к самому грубому; 100x60 выбирается в исходном окне 800x600
+LOD_LEVELS = ((800, 480), (400, 240), (200, 120), (100, 60), (50, 30), (24, 16))
+LOD_PIXELS_PER_SEGMENT = 12.0
+LOD_HYSTERESIS = 0.15
+
+use_shaders = True
+lighting_program = None
+
+use_gpu_twist = True
+twist_program = None
+torus_grids = {}
+projection_matrix = transforms.IDENTITY
+
+EYE = (3.0, 3.0, 3.0)
+TORUS_LIGHT = lighting.Light(position=(1.0, 1.0, 1.0, 0.0), ambient=(0.2, 0.2, 0.2),
+                             diffuse=(0.8, 0.8, 0.8), specular=(1.0, 1.0, 1.0))
+TORUS_MATERIAL = lighting.Material(ambient=(0.8, 0.8, 0.8), diffuse=(0.8, 0.8, 0.8),
+                                   specular=(1.0, 1.0, 1.0), shininess=50.0)
+
+TorusMesh = namedtuple("TorusMesh", ["positions", "normals", "quads", "triangles"])
+# В core profile нет GL_QUADS: каждый четырёхугольник рисуется двумя треугольниками
+QUAD_TRIANGLES = (0, 1, 3, 1, 2, 3)
+
+# Положение и нормаль считаются в шейдере из (u, v) той же формулой, что и compute_vertex
+TORUS_VERTEX_SHADER_SRC = """
+#version 330 core
+layout (location = 0) in vec2 aParam;
+
+uniform mat4 uProjection;
+uniform mat4 uModelView;
+uniform mat3 uNormalMatrix;
+uniform float uMajorRadius;
+uniform float uMinorRadius;
+uniform float uTwist;
+
+out vec3 vEyePosition;
+out vec3 vNormal;
+
+void main() {
+    float u = aParam.x;
+    float v = aParam.y + uTwist * u;
+    vec3 normal = vec3(cos(v) * cos(u), cos(v) * sin(u), sin(v));
+    vec3 position = vec3(uMajorRadius * cos(u), uMajorRadius * sin(u), 0.0) + uMinorRadius * normal;
+
+    vec4 eye = uModelView * vec4(position, 1.0);
+    vEyePosition = eye.xyz;
+    vNormal = uNormalMatrix * normal;
+    gl_Position = uProjection * eye;
+}
+"""
 
 
 def compute_vertex(u, v):
@@ -34,17 +117,111 @@ def compute_vertex(u, v):
     return (x, y, z), (nx, ny, nz)
 
 
-def display():
-    global angle
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-    glLoadIdentity()
+def torus_params(n_major, n_minor):
+    u = 2 * np.pi * np.arange(n_major) / n_major
+    v = 2 * np.pi * np.arange(n_minor) / n_minor
+    return u, v
 
-    gluLookAt(3, 3, 3, 0, 0, 0, 0, 1, 0)
 
-    glRotatef(angle, 0.0, 1.0, 0.0)
+def torus_quads(n_major, n_minor):
+    i = np.arange(n_major)[:, None]
+    j = np.arange(n_minor)[None, :]
+    i_next = (i + 1) % n_major
+    j_next = (j + 1) % n_minor
+    quads = np.stack([
+        i * n_minor + j,
+        i_next * n_minor + j,
+        i_next * n_minor + j_next,
+        i * n_minor + j_next,
+    ], axis=-1).reshape(-1, 4)
+    return quads.astype(np.uint32)
 
-    glColor3f(1.0, 1.0, 1.0)
-    glBegin(GL_QUADS)
+
+def quad_triangles(quads):
+    return np.ascontiguousarray(quads[:, QUAD_TRIANGLES]).ravel()
+
+
+def build_torus_mesh(R, r, n_major, n_minor, twist):
+    u, v = torus_params(n_major, n_minor)
+    cos_u = np.cos(u)[:, None]
+    sin_u = np.sin(u)[:, None]
+    v_twisted = v[None, :] + twist * u[:, None]
+
+    ring = R + r * np.cos(v_twisted)
+    x = ring * cos_u
+    y = ring * sin_u
+    z = r * np.sin(v_twisted)
+    positions = np.stack([x, y, z], axis=-1).reshape(-1, 3)
+
+    normals = np.stack([x - R * cos_u, y - R * sin_u, z], axis=-1).reshape(-1, 3)
+    norm = np.sqrt((normals * normals).sum(axis=1, keepdims=True))
+    normals = np.divide(normals, norm, out=normals, where=norm != 0)
+
+    quads = torus_quads(n_major, n_minor)
+    mesh = TorusMesh(positions.astype(np.float32), normals.astype(np.float32), quads, quad_triangles(quads))
+    for array in mesh:
+        array.flags.writeable = False
+    return mesh
+
+
+@lru_cache(maxsize=8)
+def get_torus_mesh(R, r, n_major, n_minor, twist):
+    return build_torus_mesh(R, r, n_major, n_minor, twist)
+
+
+def current_size():
+    if use_lod and lod_selector.level is not None:
+        return LOD_LEVELS[lod_selector.level]
+    return n_major, n_minor
+
+
+def current_twist():
+    if animate_twist:
+        phase = TWIST_SPEED * animation_time
+        return twist + TWIST_AMPLITUDE * math.sin(phase)
+    return twist
+
+
+def current_mesh():
+    return get_torus_mesh(R, r, *current_size(), current_twist())
+
+
+class LodSelector:
+    def __init__(self, levels, pixels_per_segment=LOD_PIXELS_PER_SEGMENT, hysteresis=LOD_HYSTERESIS):
+        self.levels = levels
+        self.hysteresis = hysteresis
+        # Наибольший экранный радиус, при котором уровень ещё даёт не больше pixels_per_segment
+        # пикселей на сегмент большой окружности
+        self.max_radius = [math.inf] + [size_major * pixels_per_segment / (2 * math.pi)
+                                        for size_major, _ in levels[1:]]
+        self.level = None
+
+    def select(self, radius_px):
+        if self.level is None:
+            # Первый выбор без гистерезиса: самый грубый уровень, которого хватает
+            self.level = max(k for k, limit in enumerate(self.max_radius) if radius_px <= limit)
+            return self.level
+        level = self.level
+        while level > 0 and radius_px > self.max_radius[level] * (1 + self.hysteresis):
+            level -= 1
+        while (level + 1 < len(self.levels)
+               and radius_px < self.max_radius[level + 1] * (1 - self.hysteresis)):
+            level += 1
+        self.level = level
+        return level
+
+
+lod_selector = LodSelector(LOD_LEVELS)
+
+
+def projected_radius(model_view, projection, height):
+    # Ограничивающая сфера тора с центром в начале координат объекта
+    depth = max(-float(model_view.matrix[2, 3]), 0.1)
+    return (R + r) * float(projection[1, 1]) * height / 2.0 / depth
+
+
+def build_torus_quads_scalar(n_major, n_minor):
+    quads = []
     for i in range(n_major):
         for j in range(n_minor):
             i_next = (i + 1) % n_major
@@ -55,70 +232,579 @@ def display():
             v = 2 * math.pi * j / n_minor
             v_next = 2 * math.pi * j_next / n_minor
 
-            vertex1, normal1 = compute_vertex(u, v)
-            vertex2, normal2 = compute_vertex(u_next, v)
-            vertex3, normal3 = compute_vertex(u_next, v_next)
-            vertex4, normal4 = compute_vertex(u, v_next)
+            quads.append((compute_vertex(u, v), compute_vertex(u_next, v),
+                          compute_vertex(u_next, v_next), compute_vertex(u, v_next)))
+    return quads
+
 
-            glNormal3f(*normal1)
-            glVertex3f(*vertex1)
+def benchmark_mesh(sizes=((100, 60), (500, 300), (2000, 1000)), repeat=3):
+    for size_major, size_minor in sizes:
+        start = time.perf_counter()
+        build_torus_quads_scalar(size_major, size_minor)
+        scalar_time = time.perf_counter() - start
 
-            glNormal3f(*normal2)
-            glVertex3f(*vertex2)
+        vector_time = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            build_torus_mesh(R, r, size_major, size_minor, twist)
+            vector_time = min(vector_time, time.perf_counter() - start)
 
-            glNormal3f(*normal3)
-            glVertex3f(*vertex3)
+        print(f"{size_major}x{size_minor}: scalar {scalar_time * 1000:.1f} ms, "
+              f"vectorized {vector_time * 1000:.2f} ms, "
+              f"speedup x{scalar_time / vector_time:.0f}")
 
-            glNormal3f(*normal4)
-            glVertex3f(*vertex4)
+
+def draw_torus_immediate(mesh):
+    positions = mesh.positions.tolist()
+    normals = mesh.normals.tolist()
+    glBegin(GL_QUADS)
+    for idx in mesh.quads.ravel().tolist():
+        glNormal3f(*normals[idx])
+        glVertex3f(*positions[idx])
     glEnd()
 
+
+class TorusVBO:
+    def __init__(self):
+        self.position_vbo, self.normal_vbo, self.index_vbo = glGenBuffers(3)
+        self.mesh = None
+        self.index_count = 0
+
+        # Шейдерный VAO — только generic-атрибуты, как в core profile;
+        # указатели glVertexPointer/glNormalPointer живут в отдельном VAO для fixed-function
+        self.vao, self.fixed_vao = glGenVertexArrays(2)
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.position_vbo)
+        glEnableVertexAttribArray(lighting.POSITION_LOCATION)
+        glVertexAttribPointer(lighting.POSITION_LOCATION, 3, GL_FLOAT, GL_FALSE, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, self.normal_vbo)
+        glEnableVertexAttribArray(lighting.NORMAL_LOCATION)
+        glVertexAttribPointer(lighting.NORMAL_LOCATION, 3, GL_FLOAT, GL_FALSE, 0, None)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_vbo)
+
+        glBindVertexArray(self.fixed_vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.position_vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, self.normal_vbo)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glNormalPointer(GL_FLOAT, 0, None)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_vbo)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def upload(self, mesh):
+        if mesh is self.mesh:
+            return
+        glBindBuffer(GL_ARRAY_BUFFER, self.position_vbo)
+        glBufferData(GL_ARRAY_BUFFER, mesh.positions.nbytes, mesh.positions, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, self.normal_vbo)
+        glBufferData(GL_ARRAY_BUFFER, mesh.normals.nbytes, mesh.normals, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        glBindVertexArray(self.vao)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, mesh.triangles.nbytes, mesh.triangles, GL_STATIC_DRAW)
+        glBindVertexArray(0)
+
+        self.mesh = mesh
+        self.index_count = mesh.triangles.size
+
+    def draw(self, mesh, shaders=False):
+        self.upload(mesh)
+        glBindVertexArray(self.vao if shaders else self.fixed_vao)
+        glDrawElements(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT, None)
+        glBindVertexArray(0)
+
+    def delete(self):
+        glDeleteVertexArrays(2, [self.vao, self.fixed_vao])
+        glDeleteBuffers(3, [self.position_vbo, self.normal_vbo, self.index_vbo])
+        self.mesh = None
+
+
+class TorusGrid:
+    def __init__(self, n_major, n_minor):
+        u, v = torus_params(n_major, n_minor)
+        params = np.stack(np.meshgrid(u, v, indexing="ij"), axis=-1).reshape(-1, 2)
+        params = np.ascontiguousarray(params, dtype=np.float32)
+        triangles = quad_triangles(torus_quads(n_major, n_minor))
+        self.index_count = triangles.size
+
+        self.vao = glGenVertexArrays(1)
+        self.param_vbo, self.index_vbo = glGenBuffers(2)
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.param_vbo)
+        glBufferData(GL_ARRAY_BUFFER, params.nbytes, params, GL_STATIC_DRAW)
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 0, None)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_vbo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, triangles.nbytes, triangles, GL_STATIC_DRAW)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        glBindVertexArray(self.vao)
+        glDrawElements(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT, None)
+        glBindVertexArray(0)
+
+    def delete(self):
+        glDeleteVertexArrays(1, [self.vao])
+        glDeleteBuffers(2, [self.param_vbo, self.index_vbo])
+
+
+class GpuTimer:
+    def __init__(self, depth=4):
+        # Несколько запросов в кольце: результат читается через пару кадров, без ожидания GPU
+        self.free = deque(glGenQueries(depth))
+        self.pending = deque()
+        self.active = None
+        # llvmpipe отдаёт мусор в самом первом GL_TIME_ELAPSED
+        self.discard = 1
+
+    def begin(self):
+        if not self.free:
+            return
+        self.active = self.free.popleft()
+        glBeginQuery(GL_TIME_ELAPSED, self.active)
+
+    def end(self):
+        if self.active is None:
+            return
+        glEndQuery(GL_TIME_ELAPSED)
+        self.pending.append(self.active)
+        self.active = None
+
+    def poll(self, wait=False):
+        results = []
+        while self.pending:
+            query = self.pending[0]
+            if not wait and not glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE):
+                break
+            elapsed = ctypes.c_uint64()
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(elapsed))
+            self.free.append(self.pending.popleft())
+            if self.discard:
+                self.discard -= 1
+            else:
+                results.append(elapsed.value * 1e-9)
+        return results
+
+    def delete(self):
+        glDeleteQueries(len(self.free) + len(self.pending),
+                        list(self.free) + list(self.pending))
+
+
+class FrameStats:
+    def __init__(self, name, report_every=300):
+        self.name = name
+        self.report_every = report_every
+        self.samples = []
+        self.gpu_samples = []
+        self.intervals = []
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        if self.report_every and len(self.samples) >= self.report_every:
+            self.report()
+            self.samples = []
+            self.gpu_samples = []
+            self.intervals = []
+
+    def add_gpu(self, seconds):
+        self.gpu_samples.append(seconds)
+
+    def add_interval(self, seconds):
+        self.intervals.append(seconds)
+
+    @staticmethod
+    def percentiles(samples):
+        ms = np.array(samples) * 1000.0
+        return {
+            "mean": ms.mean(),
+            "p50": np.percentile(ms, 50),
+            "p95": np.percentile(ms, 95),
+            "p99": np.percentile(ms, 99),
+            "max": ms.max(),
+        }
+
+    def summary(self):
+        if not self.samples:
+            return None
+        summary = {"frames": len(self.samples), **self.percentiles(self.samples)}
+        summary["gpu"] = self.percentiles(self.gpu_samples) if self.gpu_samples else None
+        summary["fps"] = 1.0 / np.mean(self.intervals) if self.intervals else None
+        return summary
+
+    def report(self):
+        summary = self.summary()
+        if summary is None:
+            return
+        print(f"[{self.name}] {summary['frames']} frames: mean {summary['mean']:.2f} ms, "
+              f"p50 {summary['p50']:.2f} ms, p95 {summary['p95']:.2f} ms, "
+              f"p99 {summary['p99']:.2f} ms, max {summary['max']:.2f} ms")
+        gpu = summary["gpu"]
+        if gpu is not None:
+            print(f"[{self.name}]   gpu: mean {gpu['mean']:.2f} ms, p50 {gpu['p50']:.2f} ms, "
+                  f"p95 {gpu['p95']:.2f} ms, p99 {gpu['p99']:.2f} ms, max {gpu['max']:.2f} ms")
+        if summary["fps"] is not None:
+            print(f"[{self.name}]   {summary['fps']:.1f} fps")
+
+
+frame_stats = {path: FrameStats(path) for path in ("immediate", "vbo", "shaders", "gpu-twist")}
+
+
+def render_path():
+    if not use_vbo:
+        return "immediate"
+    if not use_shaders:
+        return "vbo"
+    return "gpu-twist" if use_gpu_twist and twist_program is not None else "shaders"
+
+
+@lru_cache(maxsize=64)
+def camera_matrix(zoom):
+    return transforms.look_at(tuple(c * zoom for c in EYE), (0.0, 0.0, 0.0), (0.0, 1.0, 0.0))
+
+
+# Без кэша: угол зависит от времени и не повторяется
+def torus_model_view(angle, zoom=1.0):
+    return transforms.model_view(camera_matrix(zoom), transforms.rotation(angle, 0.0, 1.0, 0.0))
+
+
+def draw_torus(shaders=False):
+    mesh = current_mesh()
+    if use_vbo:
+        size = mesh.quads.shape[0]
+        torus_vbo = torus_vbos.get(size)
+        if torus_vbo is None:
+            torus_vbo = torus_vbos[size] = TorusVBO()
+        torus_vbo.draw(mesh, shaders)
+    else:
+        draw_torus_immediate(mesh)
+
+
+def draw_torus_grid():
+    size = current_size()
+    grid = torus_grids.get(size)
+    if grid is None:
+        grid = torus_grids[size] = TorusGrid(*size)
+    grid.draw()
+
+
+def render_scene():
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    model_view = torus_model_view(angle, zoom)
+    if use_lod:
+        lod_selector.select(projected_radius(model_view, projection_matrix, viewport_height))
+
+    # Шейдерный конвейер умеет только VBO: glBegin/glEnd не заполняет generic-атрибут нормали
+    path = render_path()
+    if path == "gpu-twist":
+        twist_program.use()
+        twist_program.set_projection(projection_matrix)
+        twist_program.set_model_view(model_view)
+        twist_program.set_float("uTwist", current_twist())
+        draw_torus_grid()
+        glUseProgram(0)
+    elif path == "shaders":
+        lighting_program.use()
+        lighting_program.set_projection(projection_matrix)
+        lighting_program.set_model_view(model_view)
+        draw_torus(shaders=True)
+        glUseProgram(0)
+    else:
+        glLoadMatrixf(model_view.matrix.T)
+        glColor3f(1.0, 1.0, 1.0)
+        draw_torus()
+
+
+def advance_animation(dt):
+    global angle, animation_time
+    angle = (angle + ROTATION_SPEED * dt) % 360
+    animation_time += dt
+
+
+def timed_render(stats):
+    if gpu_timer is not None:
+        gpu_timer.begin()
+    start = time.perf_counter()
+    render_scene()
+    stats.add(time.perf_counter() - start)
+    if gpu_timer is not None:
+        gpu_timer.end()
+        for seconds in gpu_timer.poll():
+            stats.add_gpu(seconds)
+
+
+def update_title(stats, now):
+    global last_title_update
+    if now - last_title_update < 1.0 or not stats.intervals:
+        return
+    last_title_update = now
+    recent = stats.samples[-60:]
+    title = f"Tor - {render_path()}: {len(stats.intervals[-60:]) / sum(stats.intervals[-60:]):.0f} fps, " \
+            f"cpu {np.median(recent) * 1000:.2f} ms"
+    if stats.gpu_samples:
+        title += f", gpu {np.median(stats.gpu_samples[-60:]) * 1000:.2f} ms"
+    glutSetWindowTitle(title.encode())
+
+
+def on_frame_timer(value):
+    global frame_timer_pending
+    frame_timer_pending = False
+    glutPostRedisplay()
+
+
+def schedule_next_frame(now):
+    global next_frame_deadline, frame_timer_pending
+    if target_fps <= 0 or vsync or frame_timer_pending:
+        return
+    interval = 1.0 / target_fps
+    if next_frame_deadline is None or now - next_frame_deadline > interval:
+        # Отстали больше чем на кадр — не пытаемся догонять пачкой кадров
+        next_frame_deadline = now
+    next_frame_deadline += interval
+    frame_timer_pending = True
+    glutTimerFunc(max(0, int((next_frame_deadline - now) * 1000)), on_frame_timer, 0)
+
+
+def display():
+    global last_frame_time
+    stats = frame_stats[render_path()]
+    timed_render(stats)
+
     glutSwapBuffers()
 
-    angle = (angle + 0.5) % 360
+    now = time.perf_counter()
+    if last_frame_time is not None:
+        stats.add_interval(now - last_frame_time)
+    if fixed_timestep is not None:
+        dt = fixed_timestep
+    else:
+        # Долгая пауза (перетаскивание окна, отладчик) не должна прокручивать анимацию рывком
+        dt = 0.0 if last_frame_time is None else min(now - last_frame_time, 0.25)
+    last_frame_time = now
+    advance_animation(dt)
+
+    update_title(stats, now)
+    schedule_next_frame(now)
+
+
+def set_vsync(enabled):
+    interval = 1 if enabled else 0
+    try:
+        if sys.platform.startswith("win"):
+            from OpenGL.WGL.EXT.swap_control import wglSwapIntervalEXT
+            return bool(wglSwapIntervalEXT(interval))
+        from OpenGL.GLX.MESA.swap_control import glXSwapIntervalMESA
+        if bool(glXSwapIntervalMESA):
+            return glXSwapIntervalMESA(interval) == 0
+        from OpenGL.GLX.SGI.swap_control import glXSwapIntervalSGI
+        return glXSwapIntervalSGI(interval) == 0
+    except Exception as e:
+        print("Swap interval control unavailable:", e)
+        return False
+
+
+def _benchmark_path(path, frames, label=""):
+    global use_vbo, use_shaders, use_gpu_twist
+    use_vbo = path != "immediate"
+    use_shaders = path in ("shaders", "gpu-twist")
+    use_gpu_twist = path == "gpu-twist"
+    render_scene()
+    glFinish()
+    stats = FrameStats(f"{label}{path} {'x'.join(map(str, current_size()))}", report_every=0)
+    for _ in range(frames):
+        start = time.perf_counter()
+        if gpu_timer is not None:
+            gpu_timer.begin()
+        render_scene()
+        if gpu_timer is not None:
+            gpu_timer.end()
+        glFinish()
+        stats.add(time.perf_counter() - start)
+        # Каждый кадр, как в display(): иначе кольцо запросов кончается через depth кадров
+        if gpu_timer is not None:
+            for seconds in gpu_timer.poll():
+                stats.add_gpu(seconds)
+        advance_animation(1.0 / 60.0)
+    if gpu_timer is not None:
+        for seconds in gpu_timer.poll(wait=True):
+            stats.add_gpu(seconds)
+    stats.report()
+    return stats.summary()
+
+
+def benchmark_lighting(frames=50, sizes=((500, 300), (2000, 1000))):
+    global n_major, n_minor, use_lod
+    saved = n_major, n_minor, use_lod
+    use_lod = False
+    results = {}
+    try:
+        for n_major, n_minor in sizes:
+            for path in ("vbo", "shaders"):
+                results[(path, n_major, n_minor)] = _benchmark_path(path, frames)
+    finally:
+        n_major, n_minor, use_lod = saved
+    return results
+
+
+def benchmark_lod(frames=50, zooms=(0.5, 1.0, 2.0, 4.0, 8.0)):
+    global n_major, n_minor, use_lod, zoom
+    saved = n_major, n_minor, use_lod, zoom
+    n_major, n_minor = LOD_LEVELS[0]
+    results = {}
+    try:
+        for zoom in zooms:
+            for use_lod in (False, True):
+                label = f"zoom {zoom} lod {'on' if use_lod else 'off'}: "
+                results[(zoom, use_lod)] = _benchmark_path("vbo", frames, label)
+    finally:
+        n_major, n_minor, use_lod, zoom = saved
+    return results
+
+
+def benchmark_twist(frames=50, sizes=((100, 60), (500, 300), (2000, 1000))):
+    global n_major, n_minor, use_lod, animate_twist
+    saved = n_major, n_minor, use_lod, animate_twist
+    use_lod = False
+    animate_twist = True
+    results = {}
+    try:
+        for n_major, n_minor in sizes:
+            for path in ("shaders", "gpu-twist"):
+                results[(path, n_major, n_minor)] = _benchmark_path(path, frames, "animated twist: ")
+    finally:
+        n_major, n_minor, use_lod, animate_twist = saved
+    return results
+
+
+def benchmark_render(frames=200, width=800, height=600):
+    global use_vbo, use_shaders, use_gpu_twist
+    saved = use_vbo, use_shaders, use_gpu_twist
+    init_gl()
+    reshape(width, height)
+    paths = ("immediate", "vbo", "shaders", "gpu-twist")
+    results = {path: _benchmark_path(path, frames) for path in paths}
+    results.update(benchmark_lighting(max(1, frames // 4)))
+    results.update(benchmark_lod(max(1, frames // 4)))
+    results.update(benchmark_twist(max(1, frames // 4)))
+    use_vbo, use_shaders, use_gpu_twist = saved
+    return results
 
 
 def reshape(width, height):
+    global projection_matrix, viewport_height
     glViewport(0, 0, width, height)
+    viewport_height = height
+    projection_matrix = transforms.perspective(45.0, float(width) / max(height, 1), 0.1, 50.0)
     glMatrixMode(GL_PROJECTION)
-    glLoadIdentity()
-    gluPerspective(45, float(width) / height, 0.1, 50.0)
+    glLoadMatrixf(projection_matrix.T)
     glMatrixMode(GL_MODELVIEW)
     glLoadIdentity()
 
 
 def keyboard(key, x, y):
+    global use_vbo, use_shaders, use_lod, zoom, use_gpu_twist, twist, animate_twist
     if key == b'\x1b':
+        for stats in frame_stats.values():
+            stats.report()
         sys.exit()
-
-
-def main():
-    glutInit(sys.argv)
-    glutInitDisplayMode(GLUT_DOUBLE | GLUT_RGBA | GLUT_DEPTH)
-    glutInitWindowSize(800, 600)
-    glutCreateWindow(b"Tor")
+    elif key in (b'v', b'V'):
+        frame_stats[render_path()].report()
+        use_vbo = not use_vbo
+        print("Render path:", render_path())
+    elif key in (b's', b'S') and lighting_program is not None:
+        frame_stats[render_path()].report()
+        use_shaders = not use_shaders
+        print("Render path:", render_path())
+    elif key in (b'l', b'L'):
+        use_lod = not use_lod
+        print("LOD:", "on" if use_lod else f"off ({n_major}x{n_minor})")
+    elif key in (b'+', b'='):
+        zoom = max(zoom / 1.25, 0.4)
+    elif key == b'-':
+        zoom = min(zoom * 1.25, 20.0)
+    elif key in (b'g', b'G') and twist_program is not None:
+        frame_stats[render_path()].report()
+        use_gpu_twist = not use_gpu_twist
+        print("Render path:", render_path())
+    elif key in (b'[', b']'):
+        twist += TWIST_STEP if key == b']' else -TWIST_STEP
+        print("Twist:", twist)
+    elif key in (b't', b'T'):
+        animate_twist = not animate_twist
+
+
+def init_gl():
+    global lighting_program, twist_program, use_shaders, gpu_timer
     glEnable(GL_DEPTH_TEST)
 
     glEnable(GL_LIGHTING)
     glEnable(GL_LIGHT0)
 
-    glLightfv(GL_LIGHT0, GL_POSITION, [1.0, 1.0, 1.0, 0.0])
-    glLightfv(GL_LIGHT0, GL_AMBIENT, [0.2, 0.2, 0.2, 1.0])
-    glLightfv(GL_LIGHT0, GL_DIFFUSE, [0.8, 0.8, 0.8, 1.0])
-    glLightfv(GL_LIGHT0, GL_SPECULAR, [1.0, 1.0, 1.0, 1.0])
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    glLightfv(GL_LIGHT0, GL_POSITION, TORUS_LIGHT.position)
+    glLightfv(GL_LIGHT0, GL_AMBIENT, [*TORUS_LIGHT.ambient, 1.0])
+    glLightfv(GL_LIGHT0, GL_DIFFUSE, [*TORUS_LIGHT.diffuse, 1.0])
+    glLightfv(GL_LIGHT0, GL_SPECULAR, [*TORUS_LIGHT.specular, 1.0])
     glShadeModel(GL_SMOOTH)
 
-    glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE, [0.8, 0.8, 0.8, 1.0])
-    glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, [1.0, 1.0, 1.0, 1.0])
-    glMaterialf(GL_FRONT_AND_BACK, GL_SHININESS, 50.0)
+    glMaterialfv(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE, [*TORUS_MATERIAL.diffuse, 1.0])
+    glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, [*TORUS_MATERIAL.specular, 1.0])
+    glMaterialf(GL_FRONT_AND_BACK, GL_SHININESS, TORUS_MATERIAL.shininess)
+
+    for size in LOD_LEVELS:
+        get_torus_mesh(R, r, *size, twist)
+
+    if use_shaders and lighting_program is None:
+        try:
+            lighting_program = lighting.LightingProgram(TORUS_LIGHT, TORUS_MATERIAL)
+            twist_program = lighting.LightingProgram(TORUS_LIGHT, TORUS_MATERIAL,
+                                                     vertex_shader_src=TORUS_VERTEX_SHADER_SRC)
+            twist_program.use()
+            twist_program.set_float("uMajorRadius", R)
+            twist_program.set_float("uMinorRadius", r)
+            glUseProgram(0)
+        except (GLError, RuntimeError) as e:
+            print("Shader pipeline unavailable, using fixed-function:", e)
+            use_shaders = False
+
+    if gpu_timer is None:
+        try:
+            gpu_timer = GpuTimer()
+        except (GLError, NullFunctionError):
+            gpu_timer = None
+
+
+def main():
+    global vsync
+    glutInit(sys.argv)
+    glutInitDisplayMode(GLUT_DOUBLE | GLUT_RGBA | GLUT_DEPTH)
+    glutInitWindowSize(800, 600)
+    glutCreateWindow(b"Tor")
+    init_gl()
 
     glutDisplayFunc(display)
     glutReshapeFunc(reshape)
     glutKeyboardFunc(keyboard)
-    glutIdleFunc(display)
+    if vsync and not set_vsync(True):
+        print("Vsync unavailable, pacing with the frame timer")
+        vsync = False
+    if target_fps > 0 and not vsync:
+        # Кадры по таймеру вместо холостого цикла, который съедал ядро целиком
+        glutTimerFunc(0, on_frame_timer, 0)
+    else:
+        glutIdleFunc(glutPostRedisplay)
 
     glutMainLoop()
 
 
 if __name__ == "__main__":
-    main()
+    if "--bench" in sys.argv:
+        benchmark_mesh()
+    else:
+        if "--fps" in sys.argv:
+            target_fps = float(sys.argv[sys.argv.index("--fps") + 1])
+        vsync = "--vsync" in sys.argv
+        main()
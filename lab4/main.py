@@ -1,10 +1,20 @@
 import glfw
 from OpenGL.GL import *
 from OpenGL.GL import shaders
+from OpenGL.error import NullFunctionError
 import numpy as np
 import sys
 import math
 import ctypes
+import time
+import tracemalloc
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import clipping
 
 INITIAL_WIN_WIDTH = 800
 INITIAL_WIN_HEIGHT = 600 #
@@ -13,109 +23,162 @@ CLEAR_COLOR_UINT8 = tuple(int(c * 255) for c in CLEAR_COLOR_FLOAT[:3])
 FILL_COLOR_RGB = (0, 50, 155)
 LINE_COLOR_RGB = (255, 255, 0)
 MARKER_COLOR_RGB = (255, 0, 0)
-
-
-class EdgeBucket:
-    def __init__(self, y_max, x_at_y_min, slope_inv):
-        self.y_max = y_max
-        self.x = x_at_y_min
-        self.slope_inv = slope_inv
-    def __lt__(self, other):
-        return self.x < other.x
-
-
-def draw_pixel(buffer, x, y, color_rgb):
-    h, w, _ = buffer.shape
-    x_int, y_int = int(round(x)), int(round(y))
-    if 0 <= x_int < w and 0 <= y_int < h:
-        buffer[y_int, x_int] = color_rgb
-
-def _get_background_color(buffer, x, y):
-    h, w, _ = buffer.shape
-    x_int, y_int = int(math.floor(x)), int(math.floor(y))
-    if 0 <= x_int < w and 0 <= y_int < h:
-        return buffer[y_int, x_int]
-    return CLEAR_COLOR_UINT8
-
-def _blend_colors(fg_rgb, bg_rgb, intensity):
-    fg = np.array(fg_rgb, dtype=np.float32)
-    bg = np.array(bg_rgb, dtype=np.float32)
-    blended = fg * intensity + bg * (1.0 - intensity)
-    return np.clip(blended, 0, 255).astype(np.uint8)
-
-def draw_pixel_aa(buffer, x, y, intensity, line_color_rgb):
-    h, w, _ = buffer.shape
-    x_int, y_int = int(math.floor(x)), int(math.floor(y))
-    if 0 <= x_int < w and 0 <= y_int < h:
-        bg_color = buffer[y_int, x_int].copy()  # Копируем цвет фона
-        blended_color = _blend_colors(line_color_rgb, bg_color, intensity)
-        buffer[y_int, x_int] = blended_color
-
-def filter(buffer, x0, y0, x1, y1, color_rgb):
-    def ipart(x): return math.floor(x)
-    def round_half_up(x): return ipart(x + 0.5)
-    def fpart(x): return x - math.floor(x)
-    def rfpart(x): return 1.0 - fpart(x)
-
-    steep = abs(y1 - y0) > abs(x1 - x0)
-    if steep:
-        x0, y0, x1, y1 = y0, x0, y1, x1
-    if x0 > x1:
-        x0, x1, y0, y1 = x1, x0, y1, y0
-
-    dx = x1 - x0
-    dy = y1 - y0
-    gradient = dy / dx if dx != 0.0 else 1.0
-
-    xend = round_half_up(x0)
-    yend = y0 + gradient * (xend - x0)
-    xgap = rfpart(x0 + 0.5)
-    xpxl1 = int(xend)
-    ypxl1 = ipart(yend)
-
-    if steep:
-        draw_pixel_aa(buffer, ypxl1,     xpxl1, rfpart(yend) * xgap, color_rgb)
-        draw_pixel_aa(buffer, ypxl1 + 1, xpxl1,  fpart(yend) * xgap, color_rgb)
-    else:
-        draw_pixel_aa(buffer, xpxl1, ypxl1,     rfpart(yend) * xgap, color_rgb)
-        draw_pixel_aa(buffer, xpxl1, ypxl1 + 1,  fpart(yend) * xgap, color_rgb)
-    intery = yend + gradient
-
-    xend = round_half_up(x1)
-    yend = y1 + gradient * (xend - x1)
-    xgap = fpart(x1 + 0.5)
-    xpxl2 = int(xend)
-    ypxl2 = ipart(yend)
-
-    if steep:
-        draw_pixel_aa(buffer, ypxl2,     xpxl2, rfpart(yend) * xgap, color_rgb)
-        draw_pixel_aa(buffer, ypxl2 + 1, xpxl2,  fpart(yend) * xgap, color_rgb)
-    else:
-        draw_pixel_aa(buffer, xpxl2, ypxl2,     rfpart(yend) * xgap, color_rgb)
-        draw_pixel_aa(buffer, xpxl2, ypxl2 + 1,  fpart(yend) * xgap, color_rgb)
-
-    if steep:
-        for x in range(xpxl1 + 1, xpxl2):
-            draw_pixel_aa(buffer, ipart(intery),     x, rfpart(intery), color_rgb)
-            draw_pixel_aa(buffer, ipart(intery) + 1, x,  fpart(intery), color_rgb)
-            intery += gradient
-    else:
-        for x in range(xpxl1 + 1, xpxl2):
-            draw_pixel_aa(buffer, x, ipart(intery),     rfpart(intery), color_rgb)
-            draw_pixel_aa(buffer, x, ipart(intery) + 1,  fpart(intery), color_rgb)
-            intery += gradient
-
-def draw_horizontal_line(buffer, y, x_start, x_end, color_rgb):
-    h, w, _ = buffer.shape
-    y_int = int(round(y))
-    if 0 <= y_int < h:
-        if x_start > x_end:
-            x_start, x_end = x_end, x_start
-        x_start_int = max(0, int(round(x_start)))
-        x_end_int = min(w, int(round(x_end)) + 1)
-        if x_start_int < x_end_int:
-            buffer[y_int, x_start_int:x_end_int] = color_rgb
-
+MAX_DIRTY_RECTS = 16
+RESOLVE_ROWS = 64
+
+
+FILL_RULES = ("evenodd", "nonzero")
+
+
+# pixels[y, x]: y растёт вниз, строка 0 буфера совпадает со строкой 0 текстуры
+class Framebuffer:
+    def __init__(self, width, height, rgba=False, clear_color=CLEAR_COLOR_UINT8):
+        self.width = width
+        self.height = height
+        self.rgba = rgba
+        self.storage = np.empty((height, width, 4 if rgba else 3), dtype=np.uint8)
+        self.pixels = self.storage[:, :, :3]
+        self.clear(clear_color)
+
+    def clear(self, color_rgb):
+        self.pixels[:, :] = color_rgb
+        if self.rgba:
+            self.storage[:, :, 3] = 255
+
+    @property
+    def gl_format(self):
+        return GL_RGBA if self.rgba else GL_RGB
+
+    @property
+    def gl_internal_format(self):
+        return GL_RGBA8 if self.rgba else GL_RGB8
+
+    @property
+    def bytes_per_pixel(self):
+        return self.storage.shape[2]
+
+    @property
+    def unpack_alignment(self):
+        return 4 if (self.width * self.bytes_per_pixel) % 4 == 0 else 1
+
+
+# Рисование только накапливает покрытие в float32-плоскостях (по одной на вид и цвет),
+# а в uint8-буфер всё сводится один раз за кадр: заливки, затем линии, затем маркеры.
+# Результат не зависит от порядка рисования и не копит ошибки округления при наложениях
+class CoverageLayer:
+    STAGES = ("fill", "line", "marker")
+
+    def __init__(self, width, height, background_rgb=CLEAR_COLOR_UINT8):
+        self.width = width
+        self.height = height
+        self.background = np.array(background_rgb, dtype=np.float32)
+        self.planes = {}
+
+    def plane(self, stage, color_rgb):
+        key = (stage, tuple(int(c) for c in color_rgb))
+        plane = self.planes.get(key)
+        if plane is None:
+            plane = np.zeros((self.height, self.width), dtype=np.float32)
+            self.planes[key] = plane
+            self.planes = dict(sorted(self.planes.items(), key=lambda item: self.STAGES.index(item[0][0])))
+        return plane
+
+    def fill_polygon(self, vertices, color_rgb, fill_rule="evenodd"):
+        spans = _polygon_spans(vertices, self.width, self.height, fill_rule)
+        if spans is not None:
+            _fill_spans(self.plane("fill", color_rgb), *spans, 1.0)
+
+    def draw_lines(self, segments, color_rgb):
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+        if len(segments) == 0:
+            return
+        xs, ys, coverage = _wu_segments_pixels(segments)
+        _accumulate_coverage(self.plane("line", color_rgb), xs, ys, coverage)
+
+    def resolve(self, buffer, x0, y0, x1, y1):
+        # Полосами по RESOLVE_ROWS строк: временные массивы остаются в кэше и не растут с кадром
+        for band_y0 in range(y0, y1, RESOLVE_ROWS):
+            band_y1 = min(y1, band_y0 + RESOLVE_ROWS)
+            out = np.empty((band_y1 - band_y0, x1 - x0, 3), dtype=np.float32)
+            out[:] = self.background
+            for (stage, color), plane in self.planes.items():
+                region = plane[band_y0:band_y1, x0:x1]
+                if not region.any():
+                    continue
+                # Плоскость линий хранит сумму log(1 - a) по всем наложениям
+                alpha = -np.expm1(region) if stage == "line" else region
+                out += (np.array(color, dtype=np.float32) - out) * alpha[..., None]
+            buffer[band_y0:band_y1, x0:x1] = np.rint(out).astype(np.uint8)
+
+
+def _wu_segments_pixels(segments):
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    x0, y0 = segments[:, 0, 0], segments[:, 0, 1]
+    x1, y1 = segments[:, 1, 0], segments[:, 1, 1]
+
+    steep = np.abs(y1 - y0) > np.abs(x1 - x0)
+    a0, b0 = np.where(steep, y0, x0), np.where(steep, x0, y0)
+    a1, b1 = np.where(steep, y1, x1), np.where(steep, x1, y1)
+    swap = a0 > a1
+    a0, a1 = np.where(swap, a1, a0), np.where(swap, a0, a1)
+    b0, b1 = np.where(swap, b1, b0), np.where(swap, b0, b1)
+
+    da = a1 - a0
+    gradient = np.divide(b1 - b0, da, out=np.ones_like(da), where=da != 0.0)
+
+    xend1 = np.floor(a0 + 0.5)
+    yend1 = b0 + gradient * (xend1 - a0)
+    xgap1 = 1.0 - ((a0 + 0.5) - np.floor(a0 + 0.5))
+    xend2 = np.floor(a1 + 0.5)
+    yend2 = b1 + gradient * (xend2 - a1)
+    xgap2 = (a1 + 0.5) - np.floor(a1 + 0.5)
+
+    frac1 = yend1 - np.floor(yend1)
+    frac2 = yend2 - np.floor(yend2)
+    end_along = np.concatenate([xend1, xend1, xend2, xend2])
+    end_across = np.concatenate([np.floor(yend1), np.floor(yend1) + 1,
+                                 np.floor(yend2), np.floor(yend2) + 1])
+    end_coverage = np.concatenate([(1.0 - frac1) * xgap1, frac1 * xgap1,
+                                   (1.0 - frac2) * xgap2, frac2 * xgap2])
+    end_steep = np.tile(steep, 4)
+
+    counts = np.maximum(xend2 - xend1 - 1, 0).astype(np.int64)
+    seg_ids = np.repeat(np.arange(len(segments)), counts)
+    step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    columns = xend1[seg_ids] + 1 + step
+    intery = yend1[seg_ids] + gradient[seg_ids] * (step + 1)
+    rows = np.floor(intery)
+    frac = intery - rows
+
+    along = np.concatenate([end_along, np.repeat(columns, 2)])
+    across = np.concatenate([end_across, np.stack([rows, rows + 1], axis=1).ravel()])
+    coverage = np.concatenate([end_coverage, np.stack([1.0 - frac, frac], axis=1).ravel()])
+    is_steep = np.concatenate([end_steep, np.repeat(steep[seg_ids], 2)])
+
+    xs = np.where(is_steep, across, along).astype(np.int64)
+    ys = np.where(is_steep, along, across).astype(np.int64)
+    return xs, ys, coverage
+
+def _coverage_pixels(xs, ys, coverage, width, height):
+    # Вклады в один пиксель сводятся в сумму log(1 - a); пиксели — плоские индексы по возрастанию
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    flat = ys[inside] * width + xs[inside]
+    pixels, inverse = np.unique(flat, return_inverse=True)
+    with np.errstate(divide="ignore"):
+        log_transmittance = np.bincount(inverse, weights=np.log1p(-np.clip(coverage[inside], 0.0, 1.0)),
+                                        minlength=len(pixels))
+    return pixels, log_transmittance.astype(np.float32)
+
+def _accumulate_coverage(plane, xs, ys, coverage):
+    pixels, log_transmittance = _coverage_pixels(xs, ys, coverage, plane.shape[1], plane.shape[0])
+    if len(pixels):
+        plane.reshape(-1)[pixels] += log_transmittance
+
+def polygon_segments(vertices, closed=True):
+    points = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    if closed:
+        return np.stack([points, np.roll(points, -1, axis=0)], axis=1)
+    return np.stack([points[:-1], points[1:]], axis=1)
 
 VERTEX_SHADER_SRC = """
 #version 330 core
@@ -146,68 +209,416 @@ void main()
 }
 """
 
-def fill_polygon_scanline(buffer, vertices, color_rgb):
-    if not vertices or len(vertices) < 3:
-        return
-    h, w, _ = buffer.shape
-    y_coords = [v[1] for v in vertices]
-    y_min_poly = int(round(min(y_coords)))
-    y_max_poly = int(round(max(y_coords)))
-    scan_y_start = max(0, y_min_poly)
-    scan_y_end = min(h, y_max_poly + 1)
-    if scan_y_start >= scan_y_end:
+def _build_edge_arrays(points, scan_y_start, scan_y_end):
+    x1, y1 = points[:, 0], points[:, 1]
+    next_points = np.roll(points, -1, axis=0)
+    x2, y2 = next_points[:, 0], next_points[:, 1]
+
+    keep = np.ceil(y1) != np.ceil(y2)
+    x1, y1, x2, y2 = x1[keep], y1[keep], x2[keep], y2[keep]
+    lower_first = y1 < y2
+    winding = np.where(lower_first, 1, -1).astype(np.int8)
+    y_min = np.where(lower_first, y1, y2)
+    y_max = np.where(lower_first, y2, y1)
+    x_at_y_min = np.where(lower_first, x1, x2)
+    x_at_y_max = np.where(lower_first, x2, x1)
+    dx = (x_at_y_max - x_at_y_min) / (y_max - y_min)
+
+    # Полуоткрытый диапазон строк [ceil(y_min), ceil(y_max)): цепочка рёбер пересекает строку
+    # столько же раз по чётности, сколько заменяющее её при отсечении ребро вдоль границы окна
+    y_start = np.maximum(scan_y_start, np.ceil(y_min).astype(np.int64))
+    y_end = np.minimum(scan_y_end, np.ceil(y_max).astype(np.int64))
+    keep = y_start < y_end
+    y_min, x_at_y_min, dx, y_start, y_end = y_min[keep], x_at_y_min[keep], dx[keep], y_start[keep], y_end[keep]
+
+    x = x_at_y_min + dx * (y_start - y_min)
+    return y_start.astype(np.int32), y_end.astype(np.int32), x, dx, winding[keep]
+
+def _scanline_crossings(y_start, y_end, x, dx, winding):
+    counts = y_end - y_start
+    order = np.argsort(-counts, kind="stable")
+    y_start, counts, x, dx, winding = y_start[order], counts[order], x[order].copy(), dx[order], winding[order]
+
+    total = int(counts.sum())
+    crossing_y = np.empty(total, dtype=np.int32)
+    crossing_x = np.empty(total)
+    crossing_w = np.empty(total, dtype=np.int8)
+    filled = 0
+    num_active = len(counts)
+    for step in range(int(counts[0]) if len(counts) else 0):
+        while counts[num_active - 1] <= step:
+            num_active -= 1
+        crossing_y[filled:filled + num_active] = y_start[:num_active] + step
+        crossing_x[filled:filled + num_active] = x[:num_active]
+        crossing_w[filled:filled + num_active] = winding[:num_active]
+        filled += num_active
+        # Пошаговое приращение, как edge.x += slope_inv, даёт те же самые x
+        x[:num_active] += dx[:num_active]
+
+    order = np.argsort(crossing_x)
+    if total:
+        row_keys = crossing_y[order].astype(np.min_scalar_type(int(crossing_y.max())))
+        order = order[np.argsort(row_keys, kind="stable")]
+    return crossing_y[order], crossing_x[order], crossing_w[order]
+
+SPAN_SLICE_LIMIT = 4096
+SPAN_MASK_ROWS = 64
+# Запас вокруг буфера при отсечении полигона: пересечения за краем всё равно обрезаются по пикселям
+CLIP_MARGIN = 2
+
+LOAD_CHUNK_VERTICES = 1 << 16
+CSV_EXTENSIONS = (".csv", ".txt")
+CSV_BYTES_PER_VERTEX = 24
+BLANK_LINE = re.compile(r"\n[ \t\r]*(?=\n)")
+LOAD_BATCH_VERTICES = 1 << 18
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+TILES_PER_WORKER = 4
+
+def _fill_spans(buffer, ys, x_starts, x_ends, color_rgb, slice_limit=SPAN_SLICE_LIMIT):
+    w = buffer.shape[1]
+    starts = np.maximum(0, np.rint(x_starts).astype(np.int64))
+    ends = np.minimum(w, np.rint(x_ends).astype(np.int64) + 1)
+    visible = starts < ends
+    ys, starts, ends = ys[visible], starts[visible], ends[visible]
+    if len(ys) <= slice_limit:
+        for y, start, end in zip(ys.tolist(), starts.tolist(), ends.tolist()):
+            buffer[y, start:end] = color_rgb
         return
 
-    edge_table = {y: [] for y in range(scan_y_start, scan_y_end)}
-    num_vertices = len(vertices)
-    for i in range(num_vertices):
-        p1, p2 = vertices[i], vertices[(i + 1) % num_vertices]
-        x1, y1, x2, y2 = p1[0], p1[1], p2[0], p2[1]
-        if round(y1) == round(y2):
+    # Много отрезков: маска покрытия целиком в ядрах numpy вместо цикла присваиваний,
+    # полосами по SPAN_MASK_ROWS строк, чтобы не держать маску на весь кадр.
+    # В плоском индексе полосы маска — чередование пропусков и отрезков, её строит np.repeat
+    x0, x1 = int(starts.min()), int(ends.max())
+    cols = x1 - x0
+    for y0 in range(int(ys[0]), int(ys[-1]) + 1, SPAN_MASK_ROWS):
+        lo, hi = np.searchsorted(ys, (y0, y0 + SPAN_MASK_ROWS))
+        if lo == hi:
             continue
-        if y1 < y2:
-            y_min_edge, y_max_edge, x_at_y_min = y1, y2, x1
+        rows = int(ys[hi - 1]) - y0 + 1
+        offsets = (ys[lo:hi] - y0).astype(np.int64) * cols - x0
+        flat_starts = offsets + starts[lo:hi]
+        order = np.argsort(flat_starts, kind="stable")
+        flat_starts = flat_starts[order]
+        # Вложенные и перекрывающиеся отрезки сливаются: концы не убывают и не заходят за следующее начало
+        flat_ends = np.maximum.accumulate((offsets + ends[lo:hi])[order])
+        flat_ends[:-1] = np.minimum(flat_ends[:-1], flat_starts[1:])
+        runs = np.empty(2 * len(flat_starts) + 1, dtype=np.int64)
+        runs[0] = flat_starts[0]
+        runs[2:-1:2] = flat_starts[1:] - flat_ends[:-1]
+        runs[1::2] = flat_ends - flat_starts
+        runs[-1] = rows * cols - flat_ends[-1]
+        pattern = np.zeros(len(runs), dtype=bool)
+        pattern[1::2] = True
+        inside = np.repeat(pattern, runs).reshape(rows, cols)
+        buffer[y0:y0 + rows, x0:x1][inside] = color_rgb
+
+def _polygon_spans(vertices, width, height, fill_rule="evenodd", clip=True):
+    if fill_rule not in FILL_RULES:
+        raise ValueError(f"Unknown fill rule: {fill_rule}")
+    if vertices is None or len(vertices) < 3:
+        return None
+    points = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    if clip:
+        points = clipping.clip_polygon(points, -CLIP_MARGIN, width - 1 + CLIP_MARGIN,
+                                       -CLIP_MARGIN, height - 1 + CLIP_MARGIN)
+        if len(points) < 3:
+            return None
+    scan_y_start = max(0, int(np.ceil(points[:, 1].min())))
+    scan_y_end = min(height, int(np.ceil(points[:, 1].max())))
+    if scan_y_start >= scan_y_end:
+        return None
+
+    ys, xs, windings = _scanline_crossings(*_build_edge_arrays(points, scan_y_start, scan_y_end))
+    if len(ys) == 0:
+        return None
+    index = np.arange(len(ys))
+    row_first = np.searchsorted(ys, ys, side="left")
+    row_last = np.searchsorted(ys, ys, side="right")
+    if fill_rule == "evenodd":
+        # Пары (0,1), (2,3), ... отсортированных пересечений строки
+        inside = (index - row_first) % 2 == 0
+    else:
+        total_winding = np.cumsum(windings, dtype=np.int64)
+        row_base = total_winding[row_first] - windings[row_first]
+        inside = total_winding - row_base != 0
+    first = np.flatnonzero(inside & (index + 1 < row_last))
+    # Отрезки идут по возрастанию строки
+    return ys[first], xs[first], xs[first + 1]
+
+def draw_polygon(layer, points, line_color, fill_color=None, fill_rule="evenodd", closed=True):
+    if fill_color is not None and closed:
+        layer.fill_polygon(points, fill_color, fill_rule)
+    if len(points) >= 2:
+        segments = polygon_segments(points, closed)
+        for start in range(0, len(segments), LOAD_CHUNK_VERTICES):
+            # Отсечение до растеризации: длинные рёбра за кадром не порождают пикселей
+            visible, _ = clipping.clip_segments(segments[start:start + LOAD_CHUNK_VERTICES],
+                                                -CLIP_MARGIN, layer.width - 1 + CLIP_MARGIN,
+                                                -CLIP_MARGIN, layer.height - 1 + CLIP_MARGIN)
+            layer.draw_lines(visible, line_color)
+
+def _polygon_primitives(points, width, height, line_color, fill_color, fill_rule, closed=True):
+    # То же, что draw_polygon, но без записи в слой: примитивы (вид, ключи, данные, цвет).
+    # Ключи отсортированы (строки отрезков заливки, плоские индексы пикселей линий),
+    # поэтому полоса находит свою часть через searchsorted
+    primitives = []
+    if fill_color is not None and closed:
+        spans = _polygon_spans(points, width, height, fill_rule)
+        if spans is not None:
+            primitives.append(("fill", spans[0], spans[1:], fill_color))
+    if len(points) >= 2:
+        segments = polygon_segments(points, closed)
+        for start in range(0, len(segments), LOAD_CHUNK_VERTICES):
+            visible, _ = clipping.clip_segments(segments[start:start + LOAD_CHUNK_VERTICES],
+                                                -CLIP_MARGIN, width - 1 + CLIP_MARGIN,
+                                                -CLIP_MARGIN, height - 1 + CLIP_MARGIN)
+            if len(visible) == 0:
+                continue
+            pixels, log_transmittance = _coverage_pixels(*_wu_segments_pixels(visible), width, height)
+            if len(pixels):
+                primitives.append(("line", pixels, log_transmittance, line_color))
+    return primitives
+
+def _rasterize_band(y0, y1, primitives):
+    for kind, keys, columns, plane in primitives:
+        if kind == "fill":
+            lo, hi = np.searchsorted(keys, (y0, y1))
+            if lo < hi:
+                # Маска вместо цикла присваиваний: цикл на Python держал бы GIL
+                _fill_spans(plane[y0:y1], keys[lo:hi] - y0, columns[0][lo:hi], columns[1][lo:hi], 1.0,
+                            slice_limit=0)
         else:
-            y_min_edge, y_max_edge, x_at_y_min = y2, y1, x2
-            x1, x2, y1, y2 = x2, x1, y2, y1
-        slope_inv = (x2 - x1) / (y2 - y1) if (y2 - y1) != 0 else 0.0
-        y_min_int = int(round(y_min_edge))
-        actual_y_start = max(scan_y_start, y_min_int)
-        if actual_y_start < scan_y_end and y_max_edge > actual_y_start:
-            x_adjusted = x_at_y_min + slope_inv * (actual_y_start - y_min_edge)
-            edge = EdgeBucket(y_max_edge, x_adjusted, slope_inv)
-            if actual_y_start in edge_table:
-                edge_table[actual_y_start].append(edge)
-
-    active_edge_table = []
-    for y in range(scan_y_start, scan_y_end):
-        active_edge_table = [edge for edge in active_edge_table if y < round(edge.y_max)]
-        if y in edge_table:
-            active_edge_table.extend(edge_table[y])
-        active_edge_table.sort(key=lambda edge: edge.x)
-        for i in range(0, len(active_edge_table) - 1, 2):
-            x_start, x_end = active_edge_table[i].x, active_edge_table[i+1].x
-            draw_horizontal_line(buffer, y, x_start, x_end, color_rgb)
-        for edge in active_edge_table:
-            edge.x += edge.slope_inv
+            width = plane.shape[1]
+            lo, hi = np.searchsorted(keys, (y0 * width, y1 * width))
+            if lo < hi:
+                plane.reshape(-1)[keys[lo:hi]] += columns[lo:hi]
+
+class TiledRasterizer:
+    # Два этапа на пакет многоугольников, оба параллельно в потоках (ядра numpy отпускают GIL):
+    # 1) многоугольники независимы: отрезки заливки и покрытие линий по пикселям считаются без записи в слой;
+    # 2) слой делится на полосы строк, каждая полоса накладывает свои части примитивов
+    #    в исходном порядке. Полосы не пересекаются, и каждый пиксель получает те же операции
+    #    в том же порядке, что и в draw_polygon, поэтому результат от числа потоков не зависит
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = max(1, workers)
+        self.pool = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+
+    def _map(self, func, items):
+        if self.pool is None:
+            return [func(item) for item in items]
+        return list(self.pool.map(func, items))
+
+    def draw_polygons(self, layer, polygons, line_color, fill_color=None, fill_rule="evenodd"):
+        w, h = layer.width, layer.height
+        groups = self._map(lambda points: _polygon_primitives(points, w, h, line_color, fill_color, fill_rule),
+                           polygons)
+        # Плоскости заводятся здесь, до запуска полос
+        primitives = [(kind, ys, columns, layer.plane(kind, color))
+                      for group in groups for kind, ys, columns, color in group]
+        if not primitives:
+            return
+        tile_rows = -(-h // (self.workers * TILES_PER_WORKER))
+        self._map(lambda y0: _rasterize_band(y0, min(h, y0 + tile_rows), primitives), range(0, h, tile_rows))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+def _polygon_batches(polygons, max_vertices=LOAD_BATCH_VERTICES):
+    batch, batch_vertices = [], 0
+    for polygon in polygons:
+        batch.append(polygon)
+        batch_vertices += len(polygon)
+        if batch_vertices >= max_vertices:
+            yield batch
+            batch, batch_vertices = [], 0
+    if batch:
+        yield batch
+
+def _parse_csv_values(text):
+    try:
+        return np.fromstring(text.replace("\n", ","), dtype=np.float32, sep=",")
+    except ValueError:
+        return None
+
+def _csv_bad_line(text, values, lines):
+    # Ровно одна запятая в каждой строке; считается по байтам, без цикла по строкам
+    data = np.frombuffer(text.encode(), dtype=np.uint8)
+    newlines = np.flatnonzero(data == ord("\n"))
+    commas = np.bincount(np.searchsorted(newlines, np.flatnonzero(data == ord(","))),
+                         minlength=len(newlines) + 1)[:lines]
+    bad = np.flatnonzero(commas != 1)
+    if len(bad):
+        return int(bad[0])
+    if values is not None and len(values) == 2 * lines:
+        return None
+    # Поле не разобралось как число: по строкам идём только ради номера в сообщении
+    for index, line in enumerate(text.split("\n")[:lines]):
+        parsed = _parse_csv_values(line)
+        if parsed is None or len(parsed) != 2:
+            return index
+    return 0
+
+def _csv_vertex_chunks(path, chunk_vertices):
+    with open(path) as f:
+        # Первая строка без чисел (например, "x,y") считается заголовком и пропускается
+        pending = f.readline()
+        line_no = 1
+        if pending.strip() and _parse_csv_values(pending) is None:
+            pending = ""
+            line_no = 2
+        while True:
+            # Блок целых строк; разбор целиком в numpy, без цикла по строкам
+            text = pending + f.read(chunk_vertices * CSV_BYTES_PER_VERTEX) + f.readline()
+            pending = ""
+            if not text:
+                return
+            # Пустая строка разделяет многоугольники и превращается в пару NaN
+            text = BLANK_LINE.sub("\nnan,nan", "\n" + text)[1:]
+            values = _parse_csv_values(text)
+            lines = text.count("\n") + (not text.endswith("\n"))
+            bad = _csv_bad_line(text, values, lines)
+            if bad is not None:
+                raise ValueError(f"{path}:{line_no + bad}: expected exactly two numbers 'x,y'")
+            line_no += lines
+            yield values.reshape(-1, 2)
+
+def _binary_points(path):
+    # Сырые пары float32 (x, y); страницы файла подгружаются ОС по мере чтения срезов
+    if os.path.getsize(path) == 0:
+        return np.empty((0, 2), np.float32)
+    data = np.memmap(path, dtype=np.float32, mode="r")
+    if len(data) % 2:
+        raise ValueError(f"{path}: odd number of float32 values")
+    return data.reshape(-1, 2)
+
+def _polygon_breaks(chunk):
+    return np.flatnonzero(np.isnan(chunk[:, 0]) | np.isnan(chunk[:, 1]))
+
+def _binary_polygons(path, chunk_vertices):
+    # Разделители ищутся по блокам, а многоугольник отдаётся срезом memmap без копирования,
+    # даже если он занимает несколько блоков
+    points = _binary_points(path)
+    start = 0
+    for chunk_start in range(0, len(points), chunk_vertices):
+        for end in _polygon_breaks(points[chunk_start:chunk_start + chunk_vertices]) + chunk_start:
+            if end > start:
+                yield points[start:end]
+            start = end + 1
+    if len(points) > start:
+        yield points[start:]
+
+def _csv_polygons(path, chunk_vertices):
+    # Разобранные блоки уже в памяти; склеивается только многоугольник на границе блоков
+    pieces = []
+    for chunk in _csv_vertex_chunks(path, chunk_vertices):
+        start = 0
+        for end in _polygon_breaks(chunk):
+            pieces.append(chunk[start:end])
+            polygon = pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+            pieces = []
+            start = end + 1
+            if len(polygon):
+                yield polygon
+        pieces.append(chunk[start:])
+    polygon = np.concatenate(pieces) if pieces else np.empty((0, 2), np.float32)
+    if len(polygon):
+        yield polygon
+
+def iter_polygons(path, chunk_vertices=LOAD_CHUNK_VERTICES):
+    # Многоугольники разделены строками NaN; многоугольник может занимать несколько блоков
+    if os.path.splitext(path)[1].lower() in CSV_EXTENSIONS:
+        return _csv_polygons(path, chunk_vertices)
+    return _binary_polygons(path, chunk_vertices)
+
+def _merge_rects(rects):
+    merged = []
+    for x0, y0, x1, y1 in rects:
+        i = 0
+        while i < len(merged):
+            mx0, my0, mx1, my1 = merged[i]
+            if mx0 < x1 and x0 < mx1 and my0 < y1 and y0 < my1:
+                x0, y0, x1, y1 = min(x0, mx0), min(y0, my0), max(x1, mx1), max(y1, my1)
+                merged.pop(i)
+                i = 0
+            else:
+                i += 1
+        merged.append((x0, y0, x1, y1))
+    if len(merged) > MAX_DIRTY_RECTS:
+        x0s, y0s, x1s, y1s = zip(*merged)
+        merged = [(min(x0s), min(y0s), max(x1s), max(y1s))]
+    return merged
 
 class AppState:
-    def __init__(self, fb_width, fb_height):
+    def __init__(self, fb_width, fb_height, rgba=False, workers=DEFAULT_WORKERS):
         self.fb_width = fb_width
         self.fb_height = fb_height
+        self.rgba = rgba
+        self.framebuffer = None
         self.buffer = None
         self.vertices = []
+        self.outline_closed = False
+        # Загруженные файлы: (путь, цвет линий, цвет заливки или None, правило заливки).
+        # Вершины не хранятся, при перерисовке файл читается потоком заново
+        self.loaded_files = []
+        self.fill_rule = "evenodd"
+        self.rasterizer = TiledRasterizer(workers)
+        self.layer = None
+        self.layer_rects = []
+        self.dirty_rects = []
         self.needs_buffer_update = True
         self.create_buffer()
 
     def create_buffer(self):
-        self.buffer = np.zeros((self.fb_height, self.fb_width, 3), dtype=np.uint8)
-        self.buffer[:, :] = CLEAR_COLOR_UINT8
-        print(f"Framebuffer buffer created/resized: {self.fb_width}x{self.fb_height}")
+        self.framebuffer = Framebuffer(self.fb_width, self.fb_height, self.rgba)
+        self.buffer = self.framebuffer.pixels
+        self.layer = CoverageLayer(self.fb_width, self.fb_height)
+        self.layer_rects = []
+        print(f"Framebuffer buffer created/resized: {self.fb_width}x{self.fb_height}"
+              f" ({'RGBA' if self.rgba else 'RGB'})")
+        self.dirty_rects = [(0, 0, self.fb_width, self.fb_height)]
+        self.needs_buffer_update = True
+
+    def _clamp_rect(self, x0, y0, x1, y1):
+        x0, y0 = max(0, int(math.floor(x0))), max(0, int(math.floor(y0)))
+        x1, y1 = min(self.fb_width, int(math.ceil(x1))), min(self.fb_height, int(math.ceil(y1)))
+        return (x0, y0, x1, y1) if x0 < x1 and y0 < y1 else None
+
+    # Область буфера изменилась и должна уйти в текстуру
+    def mark_dirty(self, x0, y0, x1, y1):
+        rect = self._clamp_rect(x0, y0, x1, y1)
+        if rect is not None:
+            self.dirty_rects.append(rect)
+        self.needs_buffer_update = True
+
+    # Область слоя покрытия изменилась: её нужно свести в буфер перед загрузкой
+    def mark_layer_dirty(self, x0, y0, x1, y1):
+        rect = self._clamp_rect(x0, y0, x1, y1)
+        if rect is not None:
+            self.layer_rects.append(rect)
         self.needs_buffer_update = True
 
+    def mark_points_dirty(self, points, margin):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        xs, ys = points[:, 0], points[:, 1]
+        self.mark_layer_dirty(xs.min() - margin, ys.min() - margin, xs.max() + margin + 1, ys.max() + margin + 1)
+
+    def take_dirty_rects(self):
+        rects, self.dirty_rects = self.dirty_rects, []
+        return _merge_rects(rects)
+
+    def resolve(self):
+        rects, self.layer_rects = self.layer_rects, []
+        for rect in _merge_rects(rects):
+            self.layer.resolve(self.buffer, *rect)
+            self.mark_dirty(*rect)
+
     def clear_all(self):
         self.vertices = []
+        self.outline_closed = False
+        self.loaded_files = []
         self.create_buffer()
         print("Cleared vertices and buffer.")
 
@@ -216,71 +627,246 @@ class AppState:
         if 0 <= new_vertex[0] < self.fb_width and 0 <= new_vertex[1] < self.fb_height:
             last_vertex = self.vertices[-1] if self.vertices else None
             self.vertices.append(new_vertex)
+            self.outline_closed = False
             print(f"Added vertex (fb coords): ({new_vertex[0]:.2f}, {new_vertex[1]:.2f})")
             if last_vertex:
-                filter(self.buffer, last_vertex[0], last_vertex[1],
-                        new_vertex[0], new_vertex[1], line_color)
+                self.layer.draw_lines([last_vertex, new_vertex], line_color)
+                self.mark_points_dirty([last_vertex, new_vertex], margin=2)
             self.draw_marker(new_vertex[0], new_vertex[1])
-            self.needs_buffer_update = True
         else:
             print(f"Vertex ({new_vertex[0]:.2f}, {new_vertex[1]:.2f}) out of framebuffer bounds.")
 
     def draw_marker(self, x, y, size=2, color=MARKER_COLOR_RGB):
         x_c, y_c = int(round(x)), int(round(y))
-        for i in range(max(0, x_c - size), min(self.fb_width, x_c + size + 1)):
-            for j in range(max(0, y_c - size), min(self.fb_height, y_c + size + 1)):
-                if 0 <= i < self.fb_width and 0 <= j < self.fb_height:
-                    self.buffer[j, i] = color  # Y - строка, X - столбец
+        x0, x1 = max(0, x_c - size), min(self.fb_width, x_c + size + 1)
+        y0, y1 = max(0, y_c - size), min(self.fb_height, y_c + size + 1)
+        if x0 < x1 and y0 < y1:
+            self.layer.plane("marker", color)[y0:y1, x0:x1] = 1.0  # Y - строка, X - столбец
+        self.mark_layer_dirty(x_c - size, y_c - size, x_c + size + 1, y_c + size + 1)
+
+    def fill_polygon(self, fill_color, line_color=LINE_COLOR_RGB):
+        self.layer.fill_polygon(self.vertices, fill_color, self.fill_rule)
+        # Покрытие линий складывается, поэтому дорисовывается только замыкающее ребро и только один раз
+        if not self.outline_closed:
+            self.layer.draw_lines([self.vertices[-1], self.vertices[0]], line_color)
+            self.outline_closed = True
+        self.mark_points_dirty(self.vertices, margin=2)
 
     def redraw_polygon_outline_aa(self, line_color):
         if len(self.vertices) < 2:
             return
-        num_vertices = len(self.vertices)
-        for i in range(num_vertices):
-            p1 = self.vertices[i]
-            p2 = self.vertices[(i + 1) % num_vertices]
-            filter(self.buffer, p1[0], p1[1], p2[0], p2[1], line_color)
-        self.needs_buffer_update = True
-
-    def redraw_markers(self, marker_color):
-        for vx, vy in self.vertices:
-            self.draw_marker(vx, vy, color=marker_color)
-        self.needs_buffer_update = True
+        self.layer.draw_lines(polygon_segments(self.vertices, self.outline_closed), line_color)
+        self.mark_points_dirty(self.vertices, margin=2)
+
+    def draw_polygons(self, polygons, line_color, fill_color=None, fill_rule=None):
+        self.rasterizer.draw_polygons(self.layer, polygons, line_color, fill_color, fill_rule or self.fill_rule)
+        for points in polygons:
+            self.mark_points_dirty(points, margin=2)
+
+    def _draw_vertex_file(self, path, line_color, fill_color, fill_rule, chunk_vertices=LOAD_CHUNK_VERTICES):
+        vertices = polygons = 0
+        for batch in _polygon_batches(iter_polygons(path, chunk_vertices)):
+            self.draw_polygons(batch, line_color, fill_color, fill_rule)
+            vertices += sum(len(polygon) for polygon in batch)
+            polygons += len(batch)
+        return vertices, polygons
+
+    def load_vertex_file(self, path, line_color, fill_color=None, chunk_vertices=LOAD_CHUNK_VERTICES):
+        loaded, polygons = self._draw_vertex_file(path, line_color, fill_color, self.fill_rule, chunk_vertices)
+        self.loaded_files.append((path, line_color, fill_color, self.fill_rule))
+        print(f"Loaded {loaded} vertices in {polygons} polygons from {path}")
+        return loaded
+
+    def redraw_polygons(self):
+        for path, line_color, fill_color, fill_rule in self.loaded_files:
+            try:
+                self._draw_vertex_file(path, line_color, fill_color, fill_rule)
+            except (OSError, ValueError) as e:
+                print(f"Cannot redraw {path}: {e}")
+
+    def redraw_markers(self, marker_color, size=2):
+        if not self.vertices:
+            return
+        centers = np.rint(np.asarray(self.vertices, dtype=np.float64)).astype(np.int64)
+        offsets = np.arange(-size, size + 1)
+        xs = (centers[:, 0, None, None] + offsets[None, None, :]).repeat(len(offsets), axis=1).ravel()
+        ys = (centers[:, 1, None, None] + offsets[None, :, None]).repeat(len(offsets), axis=2).ravel()
+        inside = (xs >= 0) & (xs < self.fb_width) & (ys >= 0) & (ys < self.fb_height)
+        self.layer.plane("marker", marker_color)[ys[inside], xs[inside]] = 1.0
+        self.mark_points_dirty(self.vertices, margin=size + 1)
+
+def upload_rects_direct(framebuffer, rects):
+    storage = framebuffer.storage
+    h, w, bpp = storage.shape
+    uploaded = 0
+    glPixelStorei(GL_UNPACK_ROW_LENGTH, w)
+    for x0, y0, x1, y1 in rects:
+        glPixelStorei(GL_UNPACK_SKIP_PIXELS, x0)
+        glPixelStorei(GL_UNPACK_SKIP_ROWS, y0)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, x0, y0, x1 - x0, y1 - y0, framebuffer.gl_format,
+                        GL_UNSIGNED_BYTE, storage)
+        uploaded += (x1 - x0) * (y1 - y0) * bpp
+    glPixelStorei(GL_UNPACK_ROW_LENGTH, 0)
+    glPixelStorei(GL_UNPACK_SKIP_PIXELS, 0)
+    glPixelStorei(GL_UNPACK_SKIP_ROWS, 0)
+    return uploaded
+
+def supports_buffer_storage():
+    # Точки входа PyOpenGL резолвятся и без поддержки, поэтому спрашиваем сам контекст
+    if not (bool(glBufferStorage) and bool(glFenceSync)):
+        return False
+    if (int(glGetIntegerv(GL_MAJOR_VERSION)), int(glGetIntegerv(GL_MINOR_VERSION))) >= (4, 4):
+        return True
+    extensions = {glGetStringi(GL_EXTENSIONS, i) for i in range(int(glGetIntegerv(GL_NUM_EXTENSIONS)))}
+    return b"GL_ARB_buffer_storage" in extensions
+
+class PixelUnpackRing:
+    # Кольцо PBO: CPU пишет кадр N+1 в один буфер, пока GPU читает кадр N из другого
+    # Буферы создаются сразу, чтобы отсутствие PBO обнаружилось здесь, а не посреди кадра
+    def __init__(self, size, slots=2):
+        if not (bool(glGenBuffers) and bool(glMapBufferRange) and bool(glUnmapBuffer)):
+            raise NullFunctionError("pixel buffer objects are not supported by this context")
+        self.slots = slots
+        self.persistent = supports_buffer_storage()
+        self.pbos = []
+        self.views = [None] * slots
+        self.fences = [None] * slots
+        self.capacity = 0
+        self.index = 0
+        try:
+            self._allocate(size)
+        except Exception:
+            self.delete()
+            raise
+
+    def _allocate(self, size):
+        self.delete()
+        self.pbos = [int(pbo) for pbo in glGenBuffers(self.slots)]
+        for slot, pbo in enumerate(self.pbos):
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pbo)
+            if self.persistent:
+                flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+                glBufferStorage(GL_PIXEL_UNPACK_BUFFER, size, None, flags)
+                address = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, size, flags)
+                if not address:
+                    raise RuntimeError("glMapBufferRange returned NULL")
+                self.views[slot] = np.ctypeslib.as_array((ctypes.c_ubyte * size).from_address(address))
+            else:
+                glBufferData(GL_PIXEL_UNPACK_BUFFER, size, None, GL_STREAM_DRAW)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+        self.capacity = size
+
+    def upload(self, framebuffer, rects):
+        storage = framebuffer.storage
+        bpp = storage.shape[2]
+        sizes = [(x1 - x0) * (y1 - y0) * bpp for x0, y0, x1, y1 in rects]
+        total = sum(sizes)
+        if total == 0:
+            return 0
+        if total > self.capacity:
+            self._allocate(max(total, storage.nbytes))
+
+        slot = self.index
+        self.index = (slot + 1) % self.slots
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.pbos[slot])
+        if self.persistent:
+            if self.fences[slot] is not None:
+                glClientWaitSync(self.fences[slot], GL_SYNC_FLUSH_COMMANDS_BIT, GL_TIMEOUT_IGNORED)
+                glDeleteSync(self.fences[slot])
+                self.fences[slot] = None
+            staging = self.views[slot]
+        else:
+            address = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, total,
+                                       GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+            if not address:
+                # Отображение не удалось: этот кадр грузим напрямую из памяти процесса
+                glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+                return upload_rects_direct(framebuffer, rects)
+            staging = np.ctypeslib.as_array((ctypes.c_ubyte * total).from_address(address))
+
+        offsets = []
+        offset = 0
+        for (x0, y0, x1, y1), size in zip(rects, sizes):
+            staging[offset:offset + size].reshape(y1 - y0, x1 - x0, bpp)[...] = storage[y0:y1, x0:x1]
+            offsets.append(offset)
+            offset += size
+        if not self.persistent:
+            glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+
+        # Прямоугольники лежат в PBO плотно, без выравнивания строк
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        for (x0, y0, x1, y1), offset in zip(rects, offsets):
+            glTexSubImage2D(GL_TEXTURE_2D, 0, x0, y0, x1 - x0, y1 - y0, framebuffer.gl_format,
+                            GL_UNSIGNED_BYTE, ctypes.c_void_p(offset))
+        if self.persistent:
+            self.fences[slot] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+        return total
+
+    def delete(self):
+        for slot, fence in enumerate(self.fences):
+            if fence is not None:
+                glDeleteSync(fence)
+                self.fences[slot] = None
+        if self.pbos:
+            if self.persistent:
+                for pbo in self.pbos:
+                    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pbo)
+                    glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+                glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+            glDeleteBuffers(len(self.pbos), self.pbos)
+        self.pbos = []
+        self.views = [None] * self.slots
+        self.capacity = 0
 
 class RasterizerApp:
-    def __init__(self, win_width, win_height):
-        if not glfw.init():
-            sys.exit("Failed to initialize GLFW")
-
-        glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
-        glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
-        glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
-        glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL_TRUE)
-
-        self.window = glfw.create_window(win_width, win_height,
-                                         "Scanline Fill & Wu Line AA (Core Profile)",
-                                         None, None)
-        if not self.window:
-            glfw.terminate()
-            sys.exit("Failed to create GLFW window")
-
-        glfw.make_context_current(self.window)
-        glfw.swap_interval(1)
-
-        fb_width, fb_height = glfw.get_framebuffer_size(self.window)
+    def __init__(self, win_width, win_height, rgba=False, upload_mode="direct", create_window=True,
+                 workers=DEFAULT_WORKERS):
+        self.window = None
+        if create_window:
+            if not glfw.init():
+                sys.exit("Failed to initialize GLFW")
+
+            glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
+            glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
+            glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+            glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL_TRUE)
+
+            self.window = glfw.create_window(win_width, win_height,
+                                             "Scanline Fill & Wu Line AA (Core Profile)",
+                                             None, None)
+            if not self.window:
+                glfw.terminate()
+                sys.exit("Failed to create GLFW window")
+
+            glfw.make_context_current(self.window)
+            glfw.swap_interval(1)
+
+            fb_width, fb_height = glfw.get_framebuffer_size(self.window)
+        else:
+            # Контекст уже создан снаружи (например, offscreen EGL)
+            fb_width, fb_height = win_width, win_height
 
-        self.app_state = AppState(fb_width, fb_height)
+        self.app_state = AppState(fb_width, fb_height, rgba, workers)
         self.shader_program = None
         self.texture_id = None
+        self.texture_size = None
+        self.upload_mode = upload_mode
+        self.pixel_ring = None
+        self.log_uploads = True
+        self.uploaded_bytes_last = 0
+        self.uploaded_bytes_total = 0
+        self.upload_latencies = []
         self.quad_vao = None
         self.quad_vbo = None
 
         self._init_gl_resources()
         self._configure_gl_state()
 
-        glfw.set_framebuffer_size_callback(self.window, self._resize_callback)
-        glfw.set_key_callback(self.window, self._key_callback)
-        glfw.set_mouse_button_callback(self.window, self._mouse_button_callback)
+        if self.window is not None:
+            glfw.set_framebuffer_size_callback(self.window, self._resize_callback)
+            glfw.set_key_callback(self.window, self._key_callback)
+            glfw.set_mouse_button_callback(self.window, self._mouse_button_callback)
 
 
         self._update_texture()
@@ -312,11 +898,12 @@ class RasterizerApp:
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
         glBindTexture(GL_TEXTURE_2D, 0)
 
+        # Строка 0 буфера (верх окна) лежит в строке 0 текстуры, поэтому V перевёрнут
         quad_vertices = np.array([
-            -1.0, 1.0, 0.0, 1.0,
-            -1.0, -1.0, 0.0, 0.0,
-            1.0, 1.0, 1.0, 1.0,
-            1.0, -1.0, 1.0, 0.0
+            -1.0, 1.0, 0.0, 0.0,
+            -1.0, -1.0, 0.0, 1.0,
+            1.0, 1.0, 1.0, 0.0,
+            1.0, -1.0, 1.0, 1.0
         ], dtype=np.float32)
 
         self.quad_vao = glGenVertexArrays(1)
@@ -335,32 +922,66 @@ class RasterizerApp:
         glBindBuffer(GL_ARRAY_BUFFER, 0)
         glBindVertexArray(0)
 
+        if self.upload_mode == "pbo":
+            try:
+                self.pixel_ring = PixelUnpackRing(self.app_state.framebuffer.storage.nbytes)
+                print(f"Texture uploads go through a ring of {self.pixel_ring.slots} PBOs"
+                      f" ({'persistent-mapped' if self.pixel_ring.persistent else 'map/unmap'}).")
+            except (GLError, NullFunctionError, RuntimeError) as e:
+                print(f"PBO upload unavailable ({e}), falling back to direct uploads.")
+                self.pixel_ring = None
+                self.upload_mode = "direct"
+
         print("OpenGL resources initialized (Shaders, Texture, VAO/VBO).")
 
     def _configure_gl_state(self):
         fb_width, fb_height = self.app_state.fb_width, self.app_state.fb_height
         glViewport(0, 0, fb_width, fb_height)
         glClearColor(*CLEAR_COLOR_FLOAT)
-        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
         print(f"OpenGL state configured. Viewport: {fb_width}x{fb_height}")
 
     def _update_texture(self):
-        if self.app_state.buffer is None:
+        framebuffer = self.app_state.framebuffer
+        if framebuffer is None:
             return
+        self.app_state.resolve()
 
-        h, w, _ = self.app_state.buffer.shape
+        start = time.perf_counter()
+        storage = framebuffer.storage
+        h, w, bpp = storage.shape
         glBindTexture(GL_TEXTURE_2D, self.texture_id)
-        buffer_flipped = np.flipud(self.app_state.buffer)
-        try:
-            glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, w, h, GL_RGB,
-                            GL_UNSIGNED_BYTE, buffer_flipped.tobytes())
-        except GLError:
-            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, w, h, 0, GL_RGB,
-                         GL_UNSIGNED_BYTE, buffer_flipped.tobytes())
+        glPixelStorei(GL_UNPACK_ALIGNMENT, framebuffer.unpack_alignment)
+        if self.texture_size != (w, h):
+            glTexImage2D(GL_TEXTURE_2D, 0, framebuffer.gl_internal_format, w, h, 0,
+                         framebuffer.gl_format, GL_UNSIGNED_BYTE, storage)
+            self.texture_size = (w, h)
+            self.app_state.take_dirty_rects()
+            uploaded = storage.nbytes
             print(f"Texture storage allocated/reallocated: {w}x{h}")
+        elif self.pixel_ring is not None:
+            uploaded = self.pixel_ring.upload(framebuffer, self.app_state.take_dirty_rects())
+            glPixelStorei(GL_UNPACK_ALIGNMENT, framebuffer.unpack_alignment)
+        else:
+            uploaded = upload_rects_direct(framebuffer, self.app_state.take_dirty_rects())
 
         glBindTexture(GL_TEXTURE_2D, 0)
+        latency = time.perf_counter() - start
         self.app_state.needs_buffer_update = False
+        self.uploaded_bytes_last = uploaded
+        self.uploaded_bytes_total += uploaded
+        self.upload_latencies.append(latency)
+        if self.log_uploads:
+            print(f"Texture upload ({self.upload_mode}): {uploaded} bytes "
+                  f"({uploaded / storage.nbytes:.1%} of the frame) in {latency * 1000:.2f} ms")
+
+    def release_gl_resources(self):
+        if self.pixel_ring is not None:
+            self.pixel_ring.delete()
+            self.pixel_ring = None
+        glDeleteVertexArrays(1, [self.quad_vao])
+        glDeleteBuffers(1, [self.quad_vbo])
+        glDeleteTextures(1, [self.texture_id])
+        glDeleteProgram(self.shader_program)
 
     def run(self):
         while not glfw.window_should_close(self.window):
@@ -376,10 +997,8 @@ class RasterizerApp:
                 glfw.wait_events_timeout(0.05)
 
 
-        glDeleteVertexArrays(1, [self.quad_vao])
-        glDeleteBuffers(1, [self.quad_vbo])
-        glDeleteTextures(1, [self.texture_id])
-        glDeleteProgram(self.shader_program)
+        self.release_gl_resources()
+        self.app_state.rasterizer.close()
         glfw.terminate()
         print("GLFW terminated, OpenGL resources released.")
 
@@ -398,11 +1017,14 @@ class RasterizerApp:
         if fb_width > 0 and fb_height > 0:
             print(f"Framebuffer resized to: {fb_width}x{fb_height}")
             old_vertices = self.app_state.vertices
+            old_loaded_files = self.app_state.loaded_files
             self.app_state.fb_width = fb_width
             self.app_state.fb_height = fb_height
             self.app_state.create_buffer()
             self.app_state.vertices = old_vertices
+            self.app_state.loaded_files = old_loaded_files
 
+            self.app_state.redraw_polygons()
             self.app_state.redraw_polygon_outline_aa(LINE_COLOR_RGB)
             self.app_state.redraw_markers(MARKER_COLOR_RGB)
             glViewport(0, 0, fb_width, fb_height)
@@ -418,11 +1040,14 @@ class RasterizerApp:
             elif key == glfw.KEY_F:
                 if len(self.app_state.vertices) >= 3:
                     print("Filling polygon...")
-                    fill_polygon_scanline(self.app_state.buffer, self.app_state.vertices, FILL_COLOR_RGB)
-                    self.app_state.redraw_polygon_outline_aa(LINE_COLOR_RGB)
-                    self.app_state.redraw_markers(MARKER_COLOR_RGB)
+                    # Заливка ложится под контур и маркеры при сведении слоя, перерисовывать их не нужно
+                    self.app_state.fill_polygon(FILL_COLOR_RGB)
                 else:
                     print("Need at least 3 vertices to fill.")
+            elif key == glfw.KEY_N:
+                rules = FILL_RULES
+                self.app_state.fill_rule = rules[(rules.index(self.app_state.fill_rule) + 1) % len(rules)]
+                print(f"Fill rule: {self.app_state.fill_rule}")
 
     def _mouse_button_callback(self, window, button, action, mods):
         if button == glfw.MOUSE_BUTTON_LEFT and action == glfw.PRESS:
@@ -435,6 +1060,531 @@ class RasterizerApp:
             fb_y = ypos * scale_y
             self.app_state.add_vertex(fb_x, fb_y, LINE_COLOR_RGB)
 
+
+# Прежние реализации: остались эталонами и точками сравнения для бенчмарков ниже
+class EdgeBucket:
+    __slots__ = ("y_max", "x", "slope_inv", "direction")
+
+    def __init__(self, y_max, x_at_y_min, slope_inv, direction=1):
+        self.y_max = y_max
+        self.x = x_at_y_min
+        self.slope_inv = slope_inv
+        self.direction = direction
+    def __lt__(self, other):
+        return self.x < other.x
+
+
+def _blend_colors(fg_rgb, bg_rgb, intensity):
+    fg = np.array(fg_rgb, dtype=np.float32)
+    bg = np.array(bg_rgb, dtype=np.float32)
+    blended = fg * intensity + bg * (1.0 - intensity)
+    return np.clip(blended, 0, 255).astype(np.uint8)
+
+def draw_pixel_aa(buffer, x, y, intensity, line_color_rgb):
+    h, w, _ = buffer.shape
+    x_int, y_int = int(math.floor(x)), int(math.floor(y))
+    if 0 <= x_int < w and 0 <= y_int < h:
+        bg_color = buffer[y_int, x_int].copy()  # Копируем цвет фона
+        blended_color = _blend_colors(line_color_rgb, bg_color, intensity)
+        buffer[y_int, x_int] = blended_color
+
+def filter(buffer, x0, y0, x1, y1, color_rgb):
+    def ipart(x): return math.floor(x)
+    def round_half_up(x): return ipart(x + 0.5)
+    def fpart(x): return x - math.floor(x)
+    def rfpart(x): return 1.0 - fpart(x)
+
+    steep = abs(y1 - y0) > abs(x1 - x0)
+    if steep:
+        x0, y0, x1, y1 = y0, x0, y1, x1
+    if x0 > x1:
+        x0, x1, y0, y1 = x1, x0, y1, y0
+
+    dx = x1 - x0
+    dy = y1 - y0
+    gradient = dy / dx if dx != 0.0 else 1.0
+
+    xend = round_half_up(x0)
+    yend = y0 + gradient * (xend - x0)
+    xgap = rfpart(x0 + 0.5)
+    xpxl1 = int(xend)
+    ypxl1 = ipart(yend)
+
+    if steep:
+        draw_pixel_aa(buffer, ypxl1,     xpxl1, rfpart(yend) * xgap, color_rgb)
+        draw_pixel_aa(buffer, ypxl1 + 1, xpxl1,  fpart(yend) * xgap, color_rgb)
+    else:
+        draw_pixel_aa(buffer, xpxl1, ypxl1,     rfpart(yend) * xgap, color_rgb)
+        draw_pixel_aa(buffer, xpxl1, ypxl1 + 1,  fpart(yend) * xgap, color_rgb)
+    intery = yend + gradient
+
+    xend = round_half_up(x1)
+    yend = y1 + gradient * (xend - x1)
+    xgap = fpart(x1 + 0.5)
+    xpxl2 = int(xend)
+    ypxl2 = ipart(yend)
+
+    if steep:
+        draw_pixel_aa(buffer, ypxl2,     xpxl2, rfpart(yend) * xgap, color_rgb)
+        draw_pixel_aa(buffer, ypxl2 + 1, xpxl2,  fpart(yend) * xgap, color_rgb)
+    else:
+        draw_pixel_aa(buffer, xpxl2, ypxl2,     rfpart(yend) * xgap, color_rgb)
+        draw_pixel_aa(buffer, xpxl2, ypxl2 + 1,  fpart(yend) * xgap, color_rgb)
+
+    if steep:
+        for x in range(xpxl1 + 1, xpxl2):
+            draw_pixel_aa(buffer, ipart(intery),     x, rfpart(intery), color_rgb)
+            draw_pixel_aa(buffer, ipart(intery) + 1, x,  fpart(intery), color_rgb)
+            intery += gradient
+    else:
+        for x in range(xpxl1 + 1, xpxl2):
+            draw_pixel_aa(buffer, x, ipart(intery),     rfpart(intery), color_rgb)
+            draw_pixel_aa(buffer, x, ipart(intery) + 1,  fpart(intery), color_rgb)
+            intery += gradient
+
+def _wu_line_pixels(x0, y0, x1, y1):
+    def ipart(x): return math.floor(x)
+    def round_half_up(x): return ipart(x + 0.5)
+    def fpart(x): return x - math.floor(x)
+    def rfpart(x): return 1.0 - fpart(x)
+
+    steep = abs(y1 - y0) > abs(x1 - x0)
+    if steep:
+        x0, y0, x1, y1 = y0, x0, y1, x1
+    if x0 > x1:
+        x0, x1, y0, y1 = x1, x0, y1, y0
+
+    dx = x1 - x0
+    dy = y1 - y0
+    gradient = dy / dx if dx != 0.0 else 1.0
+
+    xend = round_half_up(x0)
+    yend = y0 + gradient * (xend - x0)
+    xgap = rfpart(x0 + 0.5)
+    xpxl1 = int(xend)
+    ypxl1 = ipart(yend)
+    start_intensities = (rfpart(yend) * xgap, fpart(yend) * xgap)
+    intery = yend + gradient
+
+    xend = round_half_up(x1)
+    yend = y1 + gradient * (xend - x1)
+    xgap = fpart(x1 + 0.5)
+    xpxl2 = int(xend)
+    ypxl2 = ipart(yend)
+    end_intensities = (rfpart(yend) * xgap, fpart(yend) * xgap)
+
+    columns = np.arange(xpxl1 + 1, xpxl2, dtype=np.int64)
+    steps = np.full(len(columns), gradient)
+    if len(steps):
+        steps[0] = intery
+    intery = np.add.accumulate(steps)
+    rows = np.floor(intery)
+    frac = intery - rows
+    rows = rows.astype(np.int64)
+
+    along = np.concatenate([[xpxl1, xpxl1, xpxl2, xpxl2], np.repeat(columns, 2)])
+    across = np.concatenate([[ypxl1, ypxl1 + 1, ypxl2, ypxl2 + 1],
+                             np.stack([rows, rows + 1], axis=1).ravel()])
+    intensities = np.concatenate([start_intensities, end_intensities,
+                                  np.stack([1.0 - frac, frac], axis=1).ravel()])
+    if steep:
+        return across, along, intensities
+    return along, across, intensities
+
+def _blend_pixels(buffer, xs, ys, intensities, color_rgb):
+    h, w, _ = buffer.shape
+    inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+    xs, ys, intensities = xs[inside], ys[inside], intensities[inside]
+    fg = np.array(color_rgb, dtype=np.float32)
+    bg = buffer[ys, xs].astype(np.float32)
+    blended = (fg * intensities.astype(np.float32)[:, None]
+               + bg * (1.0 - intensities).astype(np.float32)[:, None])
+    buffer[ys, xs] = np.clip(blended, 0, 255).astype(np.uint8)
+
+def filter_vectorized(buffer, x0, y0, x1, y1, color_rgb):
+    xs, ys, intensities = _wu_line_pixels(x0, y0, x1, y1)
+    # Оба конца в одном столбце: второй конец смешивается поверх первого, как в filter()
+    if xs[0] == xs[2] or ys[0] == ys[2]:
+        _blend_pixels(buffer, xs[:2], ys[:2], intensities[:2], color_rgb)
+        xs, ys, intensities = xs[2:], ys[2:], intensities[2:]
+    _blend_pixels(buffer, xs, ys, intensities, color_rgb)
+
+def _composite_coverage(buffer, xs, ys, coverage, color_rgb):
+    h, w, _ = buffer.shape
+    pixels, log_transmittance = _coverage_pixels(xs, ys, coverage, w, h)
+    if len(pixels) == 0:
+        return
+    # Перекрытия складываются как 1 - П(1 - a_i) и смешиваются с фоном один раз
+    alpha = -np.expm1(log_transmittance)[:, None]
+    ys, xs = np.divmod(pixels, w)
+    fg = np.array(color_rgb, dtype=np.float32)
+    bg = buffer[ys, xs].astype(np.float32)
+    buffer[ys, xs] = np.clip(fg * alpha + bg * (1.0 - alpha), 0, 255).astype(np.uint8)
+
+def draw_lines_aa(buffer, segments, color_rgb):
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    if len(segments) == 0:
+        return
+    xs, ys, coverage = _wu_segments_pixels(segments)
+    _composite_coverage(buffer, xs, ys, coverage, color_rgb)
+
+def draw_horizontal_line(buffer, y, x_start, x_end, color_rgb):
+    h, w, _ = buffer.shape
+    y_int = int(round(y))
+    if 0 <= y_int < h:
+        if x_start > x_end:
+            x_start, x_end = x_end, x_start
+        x_start_int = max(0, int(round(x_start)))
+        x_end_int = min(w, int(round(x_end)) + 1)
+        if x_start_int < x_end_int:
+            buffer[y_int, x_start_int:x_end_int] = color_rgb
+
+def fill_polygon_scanline(buffer, vertices, color_rgb, fill_rule="evenodd"):
+    if fill_rule not in FILL_RULES:
+        raise ValueError(f"Unknown fill rule: {fill_rule}")
+    if not vertices or len(vertices) < 3:
+        return
+    h, w, _ = buffer.shape
+    # Строка y пересекает ребро, если y_min <= y < y_max: центры пикселей, без округления вершин
+    y_coords = [v[1] for v in vertices]
+    scan_y_start = max(0, math.ceil(min(y_coords)))
+    scan_y_end = min(h, math.ceil(max(y_coords)))
+    if scan_y_start >= scan_y_end:
+        return
+
+    edge_table = {y: [] for y in range(scan_y_start, scan_y_end)}
+    num_vertices = len(vertices)
+    for i in range(num_vertices):
+        p1, p2 = vertices[i], vertices[(i + 1) % num_vertices]
+        x1, y1, x2, y2 = p1[0], p1[1], p2[0], p2[1]
+        if math.ceil(y1) == math.ceil(y2):
+            continue
+        if y1 < y2:
+            y_min_edge, y_max_edge, x_at_y_min = y1, y2, x1
+            direction = 1
+        else:
+            y_min_edge, y_max_edge, x_at_y_min = y2, y1, x2
+            x1, x2, y1, y2 = x2, x1, y2, y1
+            direction = -1
+        slope_inv = (x2 - x1) / (y2 - y1) if (y2 - y1) != 0 else 0.0
+        y_min_int = math.ceil(y_min_edge)
+        actual_y_start = max(scan_y_start, y_min_int)
+        if actual_y_start < scan_y_end and y_max_edge > actual_y_start:
+            x_adjusted = x_at_y_min + slope_inv * (actual_y_start - y_min_edge)
+            edge = EdgeBucket(y_max_edge, x_adjusted, slope_inv, direction)
+            if actual_y_start in edge_table:
+                edge_table[actual_y_start].append(edge)
+
+    active_edge_table = []
+    for y in range(scan_y_start, scan_y_end):
+        active_edge_table = [edge for edge in active_edge_table if y < edge.y_max]
+        if y in edge_table:
+            active_edge_table.extend(edge_table[y])
+        active_edge_table.sort(key=lambda edge: edge.x)
+        if fill_rule == "evenodd":
+            for i in range(0, len(active_edge_table) - 1, 2):
+                x_start, x_end = active_edge_table[i].x, active_edge_table[i+1].x
+                draw_horizontal_line(buffer, y, x_start, x_end, color_rgb)
+        else:
+            winding = 0
+            for i in range(len(active_edge_table) - 1):
+                winding += active_edge_table[i].direction
+                if winding != 0:
+                    x_start, x_end = active_edge_table[i].x, active_edge_table[i+1].x
+                    draw_horizontal_line(buffer, y, x_start, x_end, color_rgb)
+        for edge in active_edge_table:
+            edge.x += edge.slope_inv
+
+def fill_polygon_scanline_vectorized(buffer, vertices, color_rgb, fill_rule="evenodd", clip=True):
+    h, w, _ = buffer.shape
+    spans = _polygon_spans(vertices, w, h, fill_rule, clip)
+    if spans is not None:
+        _fill_spans(buffer, *spans, color_rgb)
+
+def benchmark_filter(num_lines=200, width=1920, height=1080, seed=0):
+    rng = np.random.default_rng(seed)
+    lines = rng.uniform(-50, [width + 50, height + 50], size=(num_lines, 2, 2))
+    results = {}
+    for name, draw in (("per-pixel", filter), ("vectorized", filter_vectorized)):
+        buffer = np.zeros((height, width, 3), dtype=np.uint8)
+        buffer[:, :] = CLEAR_COLOR_UINT8
+        start = time.perf_counter()
+        for (x0, y0), (x1, y1) in lines.tolist():
+            draw(buffer, x0, y0, x1, y1, LINE_COLOR_RGB)
+        elapsed = time.perf_counter() - start
+        results[name] = buffer
+        print(f"{name}: {num_lines} lines in {elapsed * 1000:.1f} ms "
+              f"({elapsed / num_lines * 1e6:.0f} us/line)")
+    print("Identical output:", np.array_equal(results["per-pixel"], results["vectorized"]))
+
+def benchmark_lines(num_vertices=5000, width=1920, height=1080, seed=0):
+    rng = np.random.default_rng(seed)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, num_vertices))
+    radii = rng.uniform(0.3, 0.45, num_vertices) * min(width, height)
+    vertices = np.stack([width / 2 + radii * np.cos(angles),
+                         height / 2 + radii * np.sin(angles)], axis=1)
+    segments = polygon_segments(vertices)
+
+    buffer = np.zeros((height, width, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    for (x0, y0), (x1, y1) in segments.tolist():
+        filter_vectorized(buffer, x0, y0, x1, y1, LINE_COLOR_RGB)
+    per_edge = time.perf_counter() - start
+
+    buffer = np.zeros((height, width, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    draw_lines_aa(buffer, segments, LINE_COLOR_RGB)
+    batched = time.perf_counter() - start
+    print(f"{num_vertices} edges: per-edge filter {per_edge * 1000:.1f} ms, "
+          f"draw_lines_aa {batched * 1000:.1f} ms, speedup x{per_edge / batched:.1f}")
+
+def _star_polygon(num_vertices, width, height, seed):
+    rng = np.random.default_rng(seed)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, num_vertices))
+    radii = rng.uniform(0.1, 0.48, num_vertices) * min(width, height)
+    return np.stack([width / 2 + radii * np.cos(angles),
+                     height / 2 + radii * np.sin(angles)], axis=1).tolist()
+
+def _self_intersecting_polygon(num_vertices, width, height, seed):
+    rng = np.random.default_rng(seed)
+    return rng.uniform((0.05 * width, 0.05 * height), (0.95 * width, 0.95 * height),
+                       size=(num_vertices, 2)).tolist()
+
+def benchmark_fill(num_vertices=10000, width=3840, height=2160, seed=0):
+    vertices = _star_polygon(num_vertices, width, height, seed)
+    results = {}
+    for name, fill in (("edge buckets", fill_polygon_scanline),
+                       ("vectorized", fill_polygon_scanline_vectorized)):
+        buffer = np.zeros((height, width, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        fill(buffer, vertices, FILL_COLOR_RGB)
+        elapsed = time.perf_counter() - start
+        results[name] = buffer
+        print(f"{name}: {num_vertices} edges on {width}x{height} in {elapsed * 1000:.1f} ms")
+    print("Identical output:", np.array_equal(results["edge buckets"], results["vectorized"]))
+
+def _offscreen_polygon(num_vertices, width, height, seed):
+    # Огромная звезда, из которой в кадр попадает только край
+    rng = np.random.default_rng(seed)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, num_vertices))
+    radii = rng.uniform(0.98, 1.0, num_vertices) * 50 * height
+    return np.stack([width / 2 + radii * np.cos(angles),
+                     height / 2 - 49.5 * height + radii * np.sin(angles)], axis=1).tolist()
+
+def benchmark_clip_fill(num_vertices=100000, width=1920, height=1080, seed=0, num_random=400):
+    star = np.asarray(_star_polygon(num_vertices, width, height, seed))
+    edge = np.asarray(_offscreen_polygon(num_vertices, width, height, seed))
+    for name, vertices in (("on-screen", star), ("mostly off-screen", edge),
+                           ("off-screen", edge + (0, -2 * height))):
+        for fill_rule in FILL_RULES:
+            outputs = []
+            for clip in (False, True):
+                buffer = np.zeros((height, width, 3), dtype=np.uint8)
+                start = time.perf_counter()
+                fill_polygon_scanline_vectorized(buffer, vertices, FILL_COLOR_RGB, fill_rule, clip=clip)
+                elapsed = time.perf_counter() - start
+                outputs.append(buffer)
+                print(f"{name:17s} {fill_rule:8s} clip={'on ' if clip else 'off'}: {elapsed * 1000:.1f} ms")
+            print(f"{name:17s} {fill_rule:8s} identical output:", np.array_equal(*outputs))
+
+    # Отсечение не меняет заливку: случайные многоугольники, частично выходящие за кадр
+    rng = np.random.default_rng(seed)
+    polygons = [(rng.uniform(-0.3, 1.3, 2) + rng.uniform(-0.4, 0.4, (rng.integers(3, 12), 2))) * (width, height)
+                for _ in range(num_random)]
+    for fill_rule in FILL_RULES:
+        differing = 0
+        for vertices in polygons:
+            outputs = []
+            for clip in (False, True):
+                buffer = np.zeros((height, width, 3), dtype=np.uint8)
+                fill_polygon_scanline_vectorized(buffer, vertices, FILL_COLOR_RGB, fill_rule, clip=clip)
+                outputs.append(buffer)
+            differing += not np.array_equal(*outputs)
+        print(f"partially off-screen {fill_rule:8s}: {differing}/{num_random} polygons differ with clip on")
+
+def benchmark_fill_rules(num_vertices=500, width=1920, height=1080, seed=0):
+    vertices = _self_intersecting_polygon(num_vertices, width, height, seed)
+    for fill_rule in FILL_RULES:
+        outputs = []
+        for name, fill in (("edge buckets", fill_polygon_scanline),
+                           ("vectorized", fill_polygon_scanline_vectorized)):
+            buffer = np.zeros((height, width, 3), dtype=np.uint8)
+            start = time.perf_counter()
+            fill(buffer, vertices, FILL_COLOR_RGB, fill_rule)
+            elapsed = time.perf_counter() - start
+
+            buffer_for_memory = np.zeros_like(buffer)
+            tracemalloc.start()
+            fill(buffer_for_memory, vertices, FILL_COLOR_RGB, fill_rule)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            outputs.append(buffer)
+            print(f"{fill_rule:8s} {name}: {elapsed * 1000:.1f} ms, "
+                  f"peak {peak / 1024:.0f} KiB (framebuffer excluded)")
+        print(f"{fill_rule:8s} identical output:", np.array_equal(*outputs))
+
+def _write_vertex_files(directory, polygons):
+    csv_path = os.path.join(directory, "polygons.csv")
+    with open(csv_path, "w") as f:
+        for polygon in polygons:
+            # %.9g достаточно, чтобы float32 восстановился без потерь
+            np.savetxt(f, polygon, fmt="%.9g", delimiter=",")
+            f.write("\n")
+    binary_path = os.path.join(directory, "polygons.f32")
+    separator = np.full((1, 2), np.nan, dtype=np.float32)
+    np.concatenate([part for polygon in polygons for part in (polygon, separator)]).tofile(binary_path)
+    return csv_path, binary_path
+
+def _contour_polygons(num_vertices, num_polygons, width, height, seed=0):
+    # Плотные контуры с короткими рёбрами, как у картографических данных;
+    # часть контуров выходит за пределы кадра
+    rng = np.random.default_rng(seed)
+    polygons = []
+    for _ in range(num_polygons):
+        angles = np.linspace(0, 2 * np.pi, num_vertices // num_polygons, endpoint=False)
+        harmonics = rng.integers(3, 12, 3)
+        radius = rng.uniform(0.1, 0.4) * min(width, height) * (
+            1 + 0.15 * np.sin(harmonics[:, None] * angles + rng.uniform(0, 2 * np.pi, (3, 1))).sum(axis=0))
+        center = rng.uniform(0, 1, 2) * (width, height)
+        polygons.append(np.stack([center[0] + radius * np.cos(angles),
+                                  center[1] + radius * np.sin(angles)], axis=1).astype(np.float32))
+    return polygons
+
+def benchmark_load(num_vertices=1_000_000, num_polygons=20, width=1920, height=1080, seed=0):
+    polygons = _contour_polygons(num_vertices, num_polygons, width, height, seed)
+    with tempfile.TemporaryDirectory() as directory:
+        outputs = []
+        for path in _write_vertex_files(directory, polygons):
+            app_state = AppState(width, height)
+            tracemalloc.start()
+            start = time.perf_counter()
+            loaded = app_state.load_vertex_file(path, LINE_COLOR_RGB, FILL_COLOR_RGB)
+            app_state.resolve()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            app_state.rasterizer.close()
+            outputs.append(app_state.buffer)
+            print(f"{os.path.basename(path)}: {loaded} vertices in {len(polygons)} polygons, "
+                  f"{elapsed:.2f} s ({loaded / elapsed / 1e6:.2f} M vertices/s), "
+                  f"peak {peak / 2 ** 20:.1f} MiB (framebuffer excluded)")
+    print("Identical output:", np.array_equal(*outputs))
+
+def benchmark_tiles(num_vertices=1_000_000, num_polygons=200, width=3840, height=2160, seed=0):
+    polygons = _contour_polygons(num_vertices, num_polygons, width, height, seed)
+    reference = CoverageLayer(width, height)
+    start = time.perf_counter()
+    for points in polygons:
+        draw_polygon(reference, points, LINE_COLOR_RGB, FILL_COLOR_RGB)
+    serial = time.perf_counter() - start
+    print(f"serial draw_polygon: {len(polygons)} polygons, {num_vertices} vertices "
+          f"on {width}x{height} in {serial * 1000:.0f} ms")
+    for workers in sorted({1, 2, 4, DEFAULT_WORKERS}):
+        rasterizer = TiledRasterizer(workers)
+        layer = CoverageLayer(width, height)
+        start = time.perf_counter()
+        rasterizer.draw_polygons(layer, polygons, LINE_COLOR_RGB, FILL_COLOR_RGB)
+        elapsed = time.perf_counter() - start
+        rasterizer.close()
+        identical = (layer.planes.keys() == reference.planes.keys() and
+                     all(np.array_equal(plane, reference.planes[key]) for key, plane in layer.planes.items()))
+        print(f"tiled, {workers} thread(s): {elapsed * 1000:.0f} ms, speedup x{serial / elapsed:.2f}, "
+              f"identical: {identical}")
+    print(f"({DEFAULT_WORKERS} CPU cores available)")
+
+def benchmark_overdraw(num_lines=2000, width=1920, height=1080, seed=0):
+    # Пучок линий через центр кадра: пиксели у центра перекрыты сотни раз
+    rng = np.random.default_rng(seed)
+    angles = rng.uniform(0, np.pi, num_lines)
+    offsets = 0.45 * min(width, height) * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    center = np.array([width / 2, height / 2]) + rng.uniform(-20, 20, (num_lines, 2))
+    segments = np.stack([center - offsets, center + offsets], axis=1)
+
+    # Эталон без квантования: произведение (1 - a) по всем линиям, смешивание в float64
+    xs, ys, coverage = _wu_segments_pixels(segments)
+    log_transmittance = np.zeros((height, width))
+    _accumulate_coverage(log_transmittance, xs, ys, coverage)
+    background = np.array(CLEAR_COLOR_UINT8, dtype=np.float64)
+    exact = background + (np.array(LINE_COLOR_RGB) - background) * -np.expm1(log_transmittance)[..., None]
+
+    def draw_uint8(buffer, ordered):
+        for (x0, y0), (x1, y1) in ordered.tolist():
+            filter_vectorized(buffer, x0, y0, x1, y1, LINE_COLOR_RGB)
+
+    def draw_layer(buffer, ordered):
+        layer = CoverageLayer(width, height)
+        for segment in ordered:
+            layer.draw_lines(segment, LINE_COLOR_RGB)
+        layer.resolve(buffer, 0, 0, width, height)
+
+    def draw_layer_batch(buffer, ordered):
+        layer = CoverageLayer(width, height)
+        layer.draw_lines(ordered, LINE_COLOR_RGB)
+        layer.resolve(buffer, 0, 0, width, height)
+
+    orders = (np.arange(num_lines), rng.permutation(num_lines))
+    for name, draw in (("uint8 read-modify-write", draw_uint8), ("float32 layer, per line", draw_layer),
+                       ("float32 layer, one batch", draw_layer_batch)):
+        outputs = []
+        for order in orders:
+            buffer = np.empty((height, width, 3), dtype=np.uint8)
+            buffer[:] = CLEAR_COLOR_UINT8
+            start = time.perf_counter()
+            draw(buffer, segments[order])
+            elapsed = time.perf_counter() - start
+            outputs.append(buffer.astype(np.int16))
+        error = np.abs(outputs[0] - exact)
+        print(f"{name}: {num_lines} lines in {elapsed * 1000:.0f} ms; vs exact: "
+              f"max error {error.max():.2f}, mean {error.mean():.4f}; "
+              f"max difference between drawing orders {np.abs(outputs[0] - outputs[1]).max()}")
+
+def benchmark_render(frames=100, width=1920, height=1080, seed=0):
+    rng = np.random.default_rng(seed)
+    lines = rng.uniform(0, [width, height, width, height], size=(frames, 4)).tolist()
+    for upload_mode in ("direct", "pbo"):
+        app = RasterizerApp(width, height, upload_mode=upload_mode, create_window=False)
+        app.log_uploads = False
+        app.upload_latencies = []
+        frame_times = []
+        for x0, y0, x1, y1 in lines:
+            start = time.perf_counter()
+            filter_vectorized(app.app_state.buffer, x0, y0, x1, y1, LINE_COLOR_RGB)
+            app.app_state.mark_dirty(0, 0, width, height)
+            app._update_texture()
+            app.render()
+            glFinish()
+            frame_times.append(time.perf_counter() - start)
+        latency_ms = np.array(app.upload_latencies) * 1000
+        frame_ms = np.array(frame_times) * 1000
+        print(f"[{app.upload_mode}] {frames} full-frame uploads of {width}x{height}: "
+              f"upload mean {latency_ms.mean():.2f} ms, p95 {np.percentile(latency_ms, 95):.2f} ms; "
+              f"frame mean {frame_ms.mean():.2f} ms, p95 {np.percentile(frame_ms, 95):.2f} ms")
+        app.release_gl_resources()
+        app.app_state.rasterizer.close()
+
+BENCHMARKS = {
+    "filter": benchmark_filter,
+    "lines": benchmark_lines,
+    "fill": benchmark_fill,
+    "fill-rules": benchmark_fill_rules,
+    "clip-fill": benchmark_clip_fill,
+    "load": benchmark_load,
+    "tiles": benchmark_tiles,
+    "overdraw": benchmark_overdraw,
+}
+
 if __name__ == "__main__":
-    app = RasterizerApp(INITIAL_WIN_WIDTH, INITIAL_WIN_HEIGHT)
-    app.run()
+    if "--bench" in sys.argv:
+        names = [arg for arg in sys.argv[1:] if arg != "--bench"] or list(BENCHMARKS)
+        for name in names:
+            BENCHMARKS[name]()
+    else:
+        app = RasterizerApp(INITIAL_WIN_WIDTH, INITIAL_WIN_HEIGHT, rgba="--rgba" in sys.argv,
+                            upload_mode="pbo" if "--pbo" in sys.argv else "direct",
+                            workers=int(sys.argv[sys.argv.index("--threads") + 1])
+                            if "--threads" in sys.argv else DEFAULT_WORKERS)
+        if "--load" in sys.argv:
+            app.app_state.load_vertex_file(sys.argv[sys.argv.index("--load") + 1],
+                                           LINE_COLOR_RGB, FILL_COLOR_RGB)
+        app.run()
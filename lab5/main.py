@@ -1,8 +1,15 @@
+import os
 import sys
+import time
+import tracemalloc
+import numpy as np
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import clipping
+
 window_width, window_height = 800, 600
 clicks = []
 clipped_segments = []
@@ -12,6 +19,18 @@ stage = 0
 
 EPSILON = 1.0
 
+CLIP_MODES = ("analytic", "midpoint", "midpoint-recursive")
+clip_mode = "analytic"
+
+# Режим многоугольника: после задания окна щелчки добавляют вершины,
+# отсечённый контур пересчитывается на каждом щелчке
+polygon_mode = False
+polygon = []
+polygon_outline = []
+
+def window_title():
+    return f"2D Clipping (External) - {clip_mode}".encode()
+
 def classify_trivial(p1, p2):
     x1, y1 = p1; x2, y2 = p2
     if x1 < rect['xmin'] and x2 < rect['xmin']:
@@ -46,6 +65,346 @@ def midpoint_clip(p1, p2):
     segs2 = midpoint_clip((xm, ym), (x2, y2))
     return segs1 + segs2
 
+def midpoint_pieces(p1, p2, epsilon=None):
+    # Тот же обход, что у midpoint_clip, но на явном стеке: глубина не ограничена рекурсией,
+    # а куски отдаются по одному в порядке от p1 к p2
+    epsilon = EPSILON if epsilon is None else epsilon
+    stack = [(p1, p2)]
+    while stack:
+        a, b = stack.pop()
+        (x1, y1), (x2, y2) = a, b
+        if (rect['xmin'] <= x1 <= rect['xmax'] and rect['ymin'] <= y1 <= rect['ymax'] and
+            rect['xmin'] <= x2 <= rect['xmax'] and rect['ymin'] <= y2 <= rect['ymax']):
+            yield None
+        elif classify_trivial(a, b) or ((x2 - x1)**2 + (y2 - y1)**2)**0.5 < epsilon:
+            yield a, b
+        else:
+            m = (0.5 * (x1 + x2), 0.5 * (y1 + y2))
+            if m == a or m == b:
+                # Дальше делить нельзя: соседние числа double, EPSILON меньше их шага
+                yield a, b
+                continue
+            stack.append((m, b))
+            stack.append((a, m))
+
+def coalesce_segments(pieces):
+    # Соседние внешние куски одного отрезка лежат на одной прямой — склеиваем в максимальные отрезки;
+    # None означает видимую часть и разрывает текущий отрезок
+    run_start = run_end = None
+    for piece in pieces:
+        if piece is not None and run_end is not None and piece[0] == run_end:
+            run_end = piece[1]
+            continue
+        if run_start is not None:
+            yield run_start, run_end
+        run_start, run_end = piece if piece is not None else (None, None)
+    if run_start is not None:
+        yield run_start, run_end
+
+def midpoint_clip_iter(p1, p2, epsilon=None):
+    return coalesce_segments(midpoint_pieces(p1, p2, epsilon))
+
+def liang_barsky(p1, p2):
+    # Параметры [t0, t1] части отрезка внутри rect, границы включительно; None — не пересекает
+    x1, y1 = p1; x2, y2 = p2
+    dx = x2 - x1
+    dy = y2 - y1
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x1 - rect['xmin']), (dx, rect['xmax'] - x1),
+                 (-dy, y1 - rect['ymin']), (dy, rect['ymax'] - y1)):
+        if p == 0:
+            if q < 0:
+                return None
+        elif p < 0:
+            t0 = max(t0, q / p)
+        else:
+            t1 = min(t1, q / p)
+    if t0 > t1:
+        return None
+    return t0, t1
+
+def _point_at(p1, p2, t):
+    if t == 1.0:
+        return p2
+    return (p1[0] + t * (p2[0] - p1[0]), p1[1] + t * (p2[1] - p1[1]))
+
+def analytic_clip(p1, p2):
+    # Тот же результат, что у midpoint_clip (внешние части), но точно и за O(1)
+    interval = liang_barsky(p1, p2)
+    if interval is None:
+        return [(p1, p2)]
+    t0, t1 = interval
+    segments = []
+    if t0 > 0:
+        segments.append((p1, _point_at(p1, p2, t0)))
+    if t1 < 1:
+        segments.append((_point_at(p1, p2, t1), p2))
+    return segments
+
+def analytic_clip_batch(segments, xmin=None, xmax=None, ymin=None, ymax=None):
+    # segments: (N, 2, 2). Возвращает внешние части (M, 2, 2) и индекс исходного отрезка для каждой
+    bounds = [rect[k] if v is None else v
+              for k, v in (('xmin', xmin), ('xmax', xmax), ('ymin', ymin), ('ymax', ymax))]
+    return clipping.clip_segments_outside(segments, *bounds)
+
+def _concat_ranges(starts, counts):
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(counts.sum())
+
+def _expand_cells(cx0, cx1, cy0, cy1, grid_width):
+    # Для каждой рамки [cx0..cx1] x [cy0..cy1] — все номера ячеек и индекс рамки-владельца
+    nx = cx1 - cx0 + 1
+    ny = cy1 - cy0 + 1
+    counts = nx * ny
+    owner = np.repeat(np.arange(len(counts)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    nx_rep = nx[owner]
+    cells = (cy0[owner] + local // nx_rep) * grid_width + cx0[owner] + local % nx_rep
+    return cells, owner
+
+class SegmentGrid:
+    SEGMENTS_PER_CELL = 4
+    MAX_GRID_SIZE = 2048
+    MAX_CELLS_PER_SEGMENT = 64
+
+    def __init__(self, segments, cell_size=None):
+        self.segments = np.ascontiguousarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+        if len(self.segments) == 0:
+            # Пустой индекс: одна пустая ячейка, запросы сразу возвращают пустой результат
+            self.bbox = np.empty((0, 4))
+            self.origin = (0.0, 0.0)
+            self.cell_size = cell_size or 1.0
+            self.grid_width = self.grid_height = 1
+            self.oversize = np.empty(0, dtype=np.int64)
+            self.cell_segments = np.empty(0, dtype=np.int32)
+            self.cell_start = np.zeros(1, dtype=np.int64)
+            self.cell_count = np.zeros(1, dtype=np.int64)
+            return
+        xs = self.segments[:, :, 0]
+        ys = self.segments[:, :, 1]
+        self.bbox = np.stack([xs.min(axis=1), xs.max(axis=1), ys.min(axis=1), ys.max(axis=1)], axis=1)
+        self.origin = (self.bbox[:, 0].min(), self.bbox[:, 2].min())
+        width = max(self.bbox[:, 1].max() - self.origin[0], 1e-9)
+        height = max(self.bbox[:, 3].max() - self.origin[1], 1e-9)
+
+        if cell_size is None:
+            n = len(self.segments)
+            extent = np.maximum(self.bbox[:, 1] - self.bbox[:, 0], self.bbox[:, 3] - self.bbox[:, 2])
+            cell_size = max((width * height * self.SEGMENTS_PER_CELL / max(n, 1)) ** 0.5,
+                            float(np.median(extent)) if n else 0.0)
+        cell_size = max(cell_size, width / self.MAX_GRID_SIZE, height / self.MAX_GRID_SIZE)
+        self.cell_size = cell_size
+        self.grid_width = int(width // cell_size) + 1
+        self.grid_height = int(height // cell_size) + 1
+
+        cx0, cx1, cy0, cy1 = self._cell_range(*self.bbox.T)
+        # Длинные отрезки не размазываем по сотням ячеек — проверяются при каждом запросе
+        spans = (cx1 - cx0 + 1) * (cy1 - cy0 + 1)
+        oversize = spans > self.MAX_CELLS_PER_SEGMENT
+        self.oversize = np.flatnonzero(oversize)
+        indexed = np.flatnonzero(~oversize)
+
+        cells, owner = _expand_cells(cx0[indexed], cx1[indexed], cy0[indexed], cy1[indexed],
+                                     self.grid_width)
+        order = np.argsort(cells, kind="stable")
+        self.cell_segments = indexed[owner[order]].astype(np.int32)
+        counts = np.bincount(cells, minlength=self.grid_width * self.grid_height)
+        self.cell_start = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        self.cell_count = counts
+
+    def _cell_range(self, xmin, xmax, ymin, ymax):
+        def to_cell(value, origin, size):
+            cell = np.floor((np.asarray(value, dtype=np.float64) - origin) / self.cell_size)
+            return np.clip(cell, 0, size - 1).astype(np.int64)
+        return (to_cell(xmin, self.origin[0], self.grid_width),
+                to_cell(xmax, self.origin[0], self.grid_width),
+                to_cell(ymin, self.origin[1], self.grid_height),
+                to_cell(ymax, self.origin[1], self.grid_height))
+
+    def candidates(self, rects):
+        # rects: (M, 4) — xmin, xmax, ymin, ymax. Возвращает пары (номер рамки, номер отрезка)
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        if len(self.segments) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        cells, rect_of_cell = _expand_cells(*self._cell_range(*rects.T), self.grid_width)
+        counts = self.cell_count[cells]
+        segment_ids = self.cell_segments[_concat_ranges(self.cell_start[cells], counts)]
+        rect_ids = np.repeat(rect_of_cell, counts)
+        if len(self.oversize):
+            rect_ids = np.concatenate([rect_ids, np.repeat(np.arange(len(rects)), len(self.oversize))])
+            segment_ids = np.concatenate([segment_ids, np.tile(self.oversize, len(rects))])
+
+        # Отрезок попадает в несколько ячеек одной рамки — убираем повторы
+        keys = np.sort(rect_ids.astype(np.int64) * len(self.segments) + segment_ids)
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        keys = keys[first]
+        rect_ids, segment_ids = np.divmod(keys, len(self.segments))
+
+        box = self.bbox[segment_ids]
+        r = rects[rect_ids]
+        hit = (box[:, 0] <= r[:, 1]) & (box[:, 1] >= r[:, 0]) & (box[:, 2] <= r[:, 3]) & (box[:, 3] >= r[:, 2])
+        return rect_ids[hit], segment_ids[hit]
+
+    def clip(self, rects):
+        # Видимые в каждой рамке части: pieces (K, 2, 2), номер рамки и номер отрезка для каждой
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        rect_ids, segment_ids = self.candidates(rects)
+        r = rects[rect_ids]
+        pieces, kept = clipping.clip_segments(self.segments[segment_ids], r[:, 0], r[:, 1], r[:, 2], r[:, 3])
+        return pieces, rect_ids[kept], segment_ids[kept]
+
+def clip_segment(p1, p2):
+    if clip_mode == "midpoint":
+        return list(midpoint_clip_iter(p1, p2))
+    if clip_mode == "midpoint-recursive":
+        return midpoint_clip(p1, p2)
+    return analytic_clip(p1, p2)
+
+def _outside_length(segments):
+    return sum(((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2) ** 0.5 for a, b in segments)
+
+def _random_segments(num_segments, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform((-200, -150), (window_width + 200, window_height + 150),
+                         size=(num_segments, 2, 2))
+    return np.round(points)
+
+def benchmark_clip(num_segments=2000, batch_segments=1_000_000, seed=0):
+    saved = dict(rect)
+    rect.update(xmin=200, xmax=600, ymin=150, ymax=450)
+    segments = _random_segments(num_segments, seed)
+    segment_list = [(tuple(a), tuple(b)) for a, b in segments.tolist()]
+
+    results = {}
+    for name, clip in (("midpoint", midpoint_clip), ("analytic", analytic_clip)):
+        start = time.perf_counter()
+        results[name] = [clip(p1, p2) for p1, p2 in segment_list]
+        elapsed = time.perf_counter() - start
+        pieces = sum(len(r) for r in results[name])
+        print(f"{name}: {num_segments} segments in {elapsed * 1000:.1f} ms, {pieces} pieces")
+
+    # Середины режут отрезок с точностью EPSILON на каждом из не более чем двух пересечений границы
+    error = max(abs(_outside_length(m) - _outside_length(a))
+                for m, a in zip(results["midpoint"], results["analytic"]))
+    print(f"max outside-length difference vs midpoint: {error:.3f} px "
+          f"(bound {2 * EPSILON:.1f}): {'ok' if error <= 2 * EPSILON else 'MISMATCH'}")
+
+    pieces, owner = analytic_clip_batch(segments)
+    flat = [piece for r in results["analytic"] for piece in r]
+    print("batch identical to scalar analytic:",
+          len(flat) == len(pieces) and np.array_equal(np.array(flat, dtype=np.float64), pieces))
+
+    segments = _random_segments(batch_segments, seed + 1)
+    start = time.perf_counter()
+    pieces, owner = analytic_clip_batch(segments)
+    elapsed = time.perf_counter() - start
+    print(f"batch: {batch_segments} segments in {elapsed * 1000:.1f} ms, {len(pieces)} pieces")
+    rect.update(saved)
+
+def benchmark_midpoint(num_segments=2000, seed=0):
+    global EPSILON
+    saved = dict(rect), EPSILON
+    rect.update(xmin=200, xmax=600, ymin=150, ymax=450)
+    segment_list = [(tuple(a), tuple(b)) for a, b in _random_segments(num_segments, seed).tolist()]
+
+    same = all(list(midpoint_pieces(p1, p2)) == [piece for piece in
+                                                 _with_gaps(p1, p2)]
+               for p1, p2 in segment_list[:200])
+    print("explicit stack visits the same pieces as midpoint_clip:", same)
+    merged = all(list(midpoint_clip_iter(p1, p2)) == list(coalesce_segments(midpoint_clip(p1, p2)))
+                 for p1, p2 in segment_list)
+    print("coalesced output matches coalesced midpoint_clip:", merged)
+
+    for epsilon in (1.0, 1e-3, 1e-9):
+        EPSILON = epsilon
+        for name, clip in (("recursive", midpoint_clip), ("iterative", midpoint_clip_iter)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            pieces = sum(len(list(clip(p1, p2))) for p1, p2 in segment_list)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"EPSILON={epsilon:g} {name}: {elapsed * 1000:.1f} ms, {pieces} segments, "
+                  f"peak {peak / 1024:.0f} KiB")
+
+    # Деление до 1e-300 требует ~1000 уровней — больше, чем позволяет стек Python
+    EPSILON = 1e-300
+    p1, p2 = (0.0, 301.0), (800.0, 299.0)
+    try:
+        midpoint_clip(p1, p2)
+        print("recursive with EPSILON=1e-300: ok")
+    except RecursionError:
+        print("recursive with EPSILON=1e-300: RecursionError")
+    print("iterative with EPSILON=1e-300:", list(midpoint_clip_iter(p1, p2)))
+    rect.update(saved[0])
+    EPSILON = saved[1]
+
+def _map_segments(num_segments, world=10000.0, max_length=20.0, seed=0):
+    # Короткие отрезки, как у ломаных карты, плюс немного длинных
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0, world, size=(num_segments, 2))
+    lengths = rng.exponential(max_length / 3, size=num_segments)
+    lengths[rng.random(num_segments) < 0.001] *= 100
+    angles = rng.uniform(0, 2 * np.pi, size=num_segments)
+    ends = starts + lengths[:, None] * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    return np.stack([starts, ends], axis=1)
+
+def _random_rects(num_rects, world=10000.0, size=(50.0, 400.0), seed=0):
+    rng = np.random.default_rng(seed)
+    corners = rng.uniform(0, world, size=(num_rects, 2))
+    extents = rng.uniform(*size, size=(num_rects, 2))
+    return np.stack([corners[:, 0], corners[:, 0] + extents[:, 0],
+                     corners[:, 1], corners[:, 1] + extents[:, 1]], axis=1)
+
+def benchmark_grid(num_segments=1_000_000, num_rects=1000, brute_rects=10, seed=0):
+    segments = _map_segments(num_segments, seed=seed)
+    rects = _random_rects(num_rects, seed=seed + 1)
+
+    start = time.perf_counter()
+    grid = SegmentGrid(segments)
+    build = time.perf_counter() - start
+    print(f"grid: {grid.grid_width}x{grid.grid_height} cells of {grid.cell_size:.1f}, "
+          f"{len(grid.cell_segments)} entries, {len(grid.oversize)} oversize, built in {build * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    pieces, rect_ids, segment_ids = grid.clip(rects)
+    indexed = time.perf_counter() - start
+    print(f"indexed: {num_rects} rects in {indexed * 1000:.0f} ms, {len(pieces)} visible pieces")
+
+    start = time.perf_counter()
+    same = True
+    for k in range(brute_rects):
+        brute_pieces, brute_ids = clipping.clip_segments(segments, *rects[k])
+        mine = rect_ids == k
+        same &= np.array_equal(brute_ids, segment_ids[mine]) and np.array_equal(brute_pieces, pieces[mine])
+    brute = (time.perf_counter() - start) / brute_rects
+    print(f"brute force: {brute * 1000:.0f} ms per rect, ~{brute * num_rects:.1f} s for {num_rects}; "
+          f"speedup x{brute * num_rects / indexed:.0f}")
+    print("identical to brute force on the first", brute_rects, "rects:", bool(same))
+
+def _with_gaps(p1, p2):
+    # midpoint_clip с пометками None на месте видимых кусков — для сверки порядка обхода
+    x1, y1 = p1; x2, y2 = p2
+    if (rect['xmin'] <= x1 <= rect['xmax'] and rect['ymin'] <= y1 <= rect['ymax'] and
+        rect['xmin'] <= x2 <= rect['xmax'] and rect['ymin'] <= y2 <= rect['ymax']):
+        return [None]
+    if classify_trivial(p1, p2) or ((x2 - x1)**2 + (y2 - y1)**2)**0.5 < EPSILON:
+        return [(p1, p2)]
+    m = (0.5 * (x1 + x2), 0.5 * (y1 + y2))
+    return _with_gaps(p1, m) + _with_gaps(m, p2)
+
+def clipped_outline(points):
+    # Sutherland–Hodgman соединяет части невыпуклого многоугольника рёбрами вдоль границы окна:
+    # заливке они не мешают, а в контуре это лишние линии, поэтому такие рёбра отбрасываются.
+    # Точки пересечения лежат на границе точно (координата присваивается), так что сравнение точное
+    clipped = clipping.clip_polygon(points, rect['xmin'], rect['xmax'], rect['ymin'], rect['ymax'])
+    edges = np.stack([clipped, np.roll(clipped, -1, axis=0)], axis=1)
+    on_border = np.zeros(len(edges), dtype=bool)
+    for axis, bound in ((0, rect['xmin']), (0, rect['xmax']), (1, rect['ymin']), (1, rect['ymax'])):
+        on_border |= (edges[:, 0, axis] == bound) & (edges[:, 1, axis] == bound)
+    return edges[~on_border]
+
 def display():
     glClear(GL_COLOR_BUFFER_BIT)
     glPointSize(5)
@@ -59,6 +418,24 @@ def display():
         glVertex2f(rect['xmax'], rect['ymin'])
         glEnd()
 
+    if polygon:
+        glColor3f(0.2, 0.2, 0.8)
+        glEnable(GL_LINE_STIPPLE)
+        glLineStipple(1, 0xF0F0)
+        glBegin(GL_LINE_LOOP)
+        for p in polygon:
+            glVertex2f(*p)
+        glEnd()
+        glDisable(GL_LINE_STIPPLE)
+
+        if len(polygon_outline):
+            glColor3f(0.8, 0.1, 0.1)
+            glBegin(GL_LINES)
+            for pa, pb in polygon_outline:
+                glVertex2f(*pa)
+                glVertex2f(*pb)
+            glEnd()
+
     if stage >= 2:
         x1,y1 = clicks[2]; x2,y2 = clicks[3]
         glColor3f(0.2, 0.2, 0.8)
@@ -80,9 +457,17 @@ def display():
     glutSwapBuffers()
 
 def mouse(button, state, x, y):
-    global stage, clipped_segments
+    global stage, clipped_segments, polygon_outline
     if button == GLUT_LEFT_BUTTON and state == GLUT_DOWN:
         yy = window_height - y
+
+        # Вершины многоугольника живут только в polygon, clicks остаётся для окна и отрезка
+        if stage >= 1 and polygon_mode:
+            polygon.append((x, yy))
+            polygon_outline = clipped_outline(polygon)
+            glutPostRedisplay()
+            return
+
         clicks.append((x, yy))
 
         if stage == 0 and len(clicks) == 2:
@@ -93,19 +478,33 @@ def mouse(button, state, x, y):
 
         elif stage == 1 and len(clicks) == 4:
             p1, p2 = clicks[2], clicks[3]
-            clipped_segments = midpoint_clip(p1, p2)
+            clipped_segments = clip_segment(p1, p2)
             stage = 2
 
         glutPostRedisplay()
 
 def keyboard(key, x, y):
-    global clicks, stage, clipped_segments
+    global clicks, stage, clipped_segments, clip_mode
+    global polygon_mode, polygon, polygon_outline
     if key == b'r':
 
         clicks = []
         clipped_segments = []
+        polygon = []
+        polygon_outline = []
         stage = 0
         glutPostRedisplay()
+    elif key == b'p':
+        polygon_mode = not polygon_mode
+        print("Polygon mode:", "on" if polygon_mode else "off")
+        glutPostRedisplay()
+    elif key == b'm':
+        clip_mode = CLIP_MODES[(CLIP_MODES.index(clip_mode) + 1) % len(CLIP_MODES)]
+        print("Clip mode:", clip_mode)
+        glutSetWindowTitle(window_title())
+        if stage >= 2:
+            clipped_segments = clip_segment(clicks[2], clicks[3])
+        glutPostRedisplay()
     elif key == b'\x1b':
         sys.exit(0)
 
@@ -123,7 +522,7 @@ def main():
     glutInit(sys.argv)
     glutInitDisplayMode(GLUT_DOUBLE | GLUT_RGBA)
     glutInitWindowSize(window_width, window_height)
-    glutCreateWindow(b"2D Midpoint Clipping (External)")
+    glutCreateWindow(window_title())
     glutDisplayFunc(display)
     glutReshapeFunc(reshape)
     glutMouseFunc(mouse)
@@ -133,4 +532,9 @@ def main():
     glutMainLoop()
 
 if __name__ == '__main__':
-    main()
+    if "--bench" in sys.argv:
+        benchmark_clip()
+        benchmark_midpoint()
+        benchmark_grid()
+    else:
+        main()